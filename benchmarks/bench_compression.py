@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+#
+# Flask-WaffleConf - https://github.com/rmed/flask-waffleconf
+#
+# Copyright (C) 2015, 2016  Rafael Medina García <rafamedgar@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""Compare stored sizes and speed of compressed and uncompressed values.
+
+Usage::
+
+    python -m benchmarks.bench_compression [--number N] [--json results.json]
+"""
+
+from __future__ import absolute_import, print_function
+
+import argparse
+import random
+import timeit
+
+from benchmarks import common
+from flask_waffleconf import util
+
+
+def _records(size):
+    """Build a list of records of roughly the given size when serialized.
+
+    Arguments:
+        size (int): Approximate size in bytes.
+
+    Returns:
+        list of dicts similar to those found in configuration values.
+    """
+    return [
+        {'id': i, 'name': 'feature-%d' % i, 'enabled': i % 3 == 0,
+         'limit': i * 10, 'tags': ['beta', 'internal']}
+        for i in range(max(1, size // 100))]
+
+def _random(size):
+    """Build a string that does not compress well.
+
+    Arguments:
+        size (int): Length of the string.
+
+    Returns:
+        Random string.
+    """
+    rand = random.Random(size)
+
+    return ''.join(rand.choice('0123456789abcdef') for _ in range(size))
+
+PAYLOADS = {
+    'records_1k': _records(1024),
+    'records_16k': _records(16384),
+    'records_128k': _records(131072),
+    'random_16k': _random(16384),
+}
+
+FORMATS = ['pickle', 'json']
+
+COMPRESSIONS = ['none', 'zlib', 'lzma']
+
+# Threshold used when compressing
+THRESHOLD = 512
+
+
+def bench(fmt, compression, payload, number):
+    """Measure a serialization format and compression on a payload.
+
+    Arguments:
+        fmt (str): Name of the serializer.
+        compression (str): Name of the compression format or ``'none'``.
+        payload: Object to serialize.
+        number (int): Number of iterations.
+
+    Returns:
+        dict with the stored size (characters) and the time per
+        serialization and deserialization (microseconds).
+    """
+    threshold = 0 if compression == 'none' else THRESHOLD
+
+    def dumps():
+        return util.serialize(payload, fmt, threshold, compression)
+
+    stored = dumps()
+
+    dumps_time = timeit.timeit(dumps, number=number)
+    loads_time = timeit.timeit(
+        lambda: util.deserialize(stored), number=number)
+
+    return {
+        'size': len(stored),
+        'dumps_us': dumps_time / number * 1e6,
+        'loads_us': loads_time / number * 1e6,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--number', type=int, default=200)
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args()
+
+    results = []
+
+    for name in sorted(PAYLOADS):
+        for fmt in FORMATS:
+            for compression in COMPRESSIONS:
+                if compression not in ('none', 'zlib') and \
+                        compression not in util._COMPRESSIONS:
+                    # Not available
+                    continue
+
+                result = {
+                    'payload': name,
+                    'format': fmt,
+                    'compression': compression,
+                }
+                result.update(bench(
+                    fmt, compression, PAYLOADS[name], args.number))
+                results.append(result)
+
+    common.report('compression', results, args.json)
+
+
+if __name__ == '__main__':
+    main()
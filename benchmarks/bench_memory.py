@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+#
+# Flask-WaffleConf - https://github.com/rmed/flask-waffleconf
+#
+# Copyright (C) 2015, 2016  Rafael Medina García <rafamedgar@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""Measure memory used by stored values with and without WAFFLE_LAZY_VALUES.
+
+Usage::
+
+    python -m benchmarks.bench_memory [--access FRACTION] [--json results.json]
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import gc
+import os
+import shutil
+import tempfile
+import tracemalloc
+from timeit import default_timer
+
+from benchmarks import common
+
+# Minimum size of lazily deserialized values in the 'lazy' mode
+LAZY_THRESHOLD = 1024
+
+VALUE_SIZES = [1024, 16384, 131072]
+
+
+def make_confs(num_keys, value_size):
+    """Build a ``WAFFLE_CONFS`` setting with realistic large values.
+
+    Default values are lists of distinct records (as in a list of
+    users or rules) of roughly the given size.
+
+    Arguments:
+        num_keys (int): Number of configuration variables.
+        value_size (int): Approximate size of each value (in characters).
+
+    Returns:
+        dict to use as ``WAFFLE_CONFS``.
+    """
+    confs = {}
+
+    for i in range(num_keys):
+        value = [
+            {'id': j, 'name': 'item-%d-%d' % (i, j), 'enabled': bool(j % 2)}
+            for j in range(max(1, value_size // 50))]
+        confs['BENCH_%d' % i] = {'desc': 'Key %d' % i, 'default': value}
+
+    return confs
+
+def bench(backend, num_keys, value_size, access):
+    """Measure the memory used after loading and accessing values.
+
+    Arguments:
+        backend (str): Either 'alchemy', 'peewee' or 'sqlite3'.
+        num_keys (int): Number of configuration variables.
+        value_size (int): Approximate size of each value (in characters).
+        access (float): Fraction of the keys accessed after loading.
+
+    Returns:
+        list of results (one for each mode).
+    """
+    tmp_dir = tempfile.mkdtemp()
+    db_path = os.path.join(tmp_dir, 'bench.db')
+    confs = make_confs(num_keys, value_size)
+    accessed = sorted(confs.keys())[:int(num_keys * access)]
+    results = []
+
+    try:
+        # Store the default values
+        common.make_state(backend, db_path, confs).parse_conf()
+
+        for mode, threshold in (('eager', 0), ('lazy', LAZY_THRESHOLD)):
+            state = common.make_state(
+                backend, db_path, confs, {'WAFFLE_LAZY_VALUES': threshold})
+            config = state.app.config
+
+            gc.collect()
+            tracemalloc.start()
+
+            start = default_timer()
+
+            # parse_conf() deserializes every value: load like a reload does
+            with state.app.app_context():
+                state.update_conf()
+
+            load = default_timer() - start
+
+            gc.collect()
+            loaded = tracemalloc.get_traced_memory()[0]
+
+            start = default_timer()
+
+            for key in accessed:
+                config[key]
+
+            read = default_timer() - start
+
+            gc.collect()
+            used = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+
+            results.append({
+                'backend': backend,
+                'keys': num_keys,
+                'value_size': value_size,
+                'mode': mode,
+                'load_ms': load * 1000,
+                'loaded_kb': loaded / 1024,
+                'access_ms': read * 1000,
+                'accessed_kb': used / 1024,
+            })
+
+            del state, config
+
+    finally:
+        shutil.rmtree(tmp_dir)
+
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--backend', action='append', choices=common.BACKENDS)
+    parser.add_argument('--keys', type=int, action='append')
+    parser.add_argument('--value-size', type=int, action='append')
+    parser.add_argument('--access', type=float, default=0.1,
+                        help='fraction of the keys accessed after loading')
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args()
+
+    results = []
+
+    for backend in args.backend or ['peewee']:
+        for num_keys in args.keys or [100]:
+            for value_size in args.value_size or VALUE_SIZES:
+                results.extend(
+                    bench(backend, num_keys, value_size, args.access))
+
+    common.report('memory', results, args.json)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+#
+# Flask-WaffleConf - https://github.com/rmed/flask-waffleconf
+#
+# Copyright (C) 2015, 2016  Rafael Medina García <rafamedgar@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+"""Measure how long an update takes to reach other processes.
+
+A number of worker processes are started with multiprocess notifications
+enabled. The main process then updates a configuration variable containing
+the current time and each worker reports when the new value is applied.
+
+Usage::
+
+    python -m benchmarks.bench_propagation [--workers N] [--updates N]
+        [--watchtype file|inotify|redis] [--json results.json]
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import multiprocessing
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from benchmarks import common
+
+# Variable updated by the main process
+SENT_KEY = 'BENCH_SENT'
+
+
+def _worker(backend, db_path, confs, config, queue):
+    """Run a worker process that reports when updates are applied.
+
+    Arguments:
+        backend (str): Either 'alchemy', 'peewee' or 'sqlite3'.
+        db_path (str): Path to the SQLite database file.
+        confs (dict): ``WAFFLE_CONFS`` setting.
+        config (dict): Additional configuration for the application.
+        queue: Queue in which to put the reports.
+    """
+    state = common.make_state(backend, db_path, confs, config)
+    state.update_conf()
+
+    update_conf = state.update_conf
+
+    def timed_update_conf(keys=None, revision=None):
+        before = state.app.config.get(SENT_KEY)
+        update_conf(keys, revision)
+        sent = state.app.config.get(SENT_KEY)
+
+        if sent != before:
+            queue.put(('applied', sent, time.time()))
+
+    state.update_conf = timed_update_conf
+    queue.put(('ready', os.getpid(), None))
+
+    while True:
+        time.sleep(60)
+
+def _updater(backend, db_path, confs, config, queue, updates, pause):
+    """Run the process that updates the configuration.
+
+    Arguments:
+        backend (str): Either 'alchemy', 'peewee' or 'sqlite3'.
+        db_path (str): Path to the SQLite database file.
+        confs (dict): ``WAFFLE_CONFS`` setting.
+        config (dict): Additional configuration for the application.
+        queue: Queue in which to put the times of the updates.
+        updates (int): Number of updates to perform.
+        pause (float): Average number of seconds to wait between updates.
+    """
+    state = common.make_state(backend, db_path, confs, config)
+    state.update_conf()
+
+    # Let watchers start
+    time.sleep(0.5)
+
+    for _ in range(updates):
+        sent = time.time()
+        state.update_db({SENT_KEY: sent})
+        queue.put(('sent', sent, None))
+
+        # Avoid synchronizing with the polling interval
+        time.sleep(random.uniform(0.5, 1.5) * pause)
+
+    queue.put(('done', None, None))
+
+def bench(backend, watchtype, num_workers, num_keys, updates, interval):
+    """Measure propagation latency for a deployment.
+
+    Arguments:
+        backend (str): Either 'alchemy', 'peewee' or 'sqlite3'.
+        watchtype (str): Value of the ``WAFFLE_WATCHTYPE`` setting.
+        num_workers (int): Number of worker processes.
+        num_keys (int): Number of configuration variables.
+        updates (int): Number of updates to perform.
+        interval (float): Value of the ``WAFFLE_WATCHER_INTERVAL`` setting.
+
+    Returns:
+        Result dict.
+    """
+    tmp_dir = tempfile.mkdtemp()
+    db_path = os.path.join(tmp_dir, 'bench.db')
+
+    confs = common.make_confs(num_keys, 16)
+    confs[SENT_KEY] = {'desc': 'Time of the update', 'default': 0.0}
+
+    config = {
+        'WAFFLE_MULTIPROC': True,
+        'WAFFLE_WATCHTYPE': watchtype,
+        'WAFFLE_WATCHER_FILE': os.path.join(tmp_dir, 'watch.txt'),
+        'WAFFLE_WATCHER_INTERVAL': interval,
+        'WAFFLE_REDIS_CHANNEL': 'waffleconf-bench-%d' % os.getpid(),
+    }
+
+    # Create the database before starting any process
+    common.make_state(backend, db_path, confs).parse_conf()
+
+    # Processes must not inherit threads or connections
+    ctx = multiprocessing.get_context('spawn')
+    queue = ctx.Queue()
+    processes = []
+
+    sent = set()
+    latencies = []
+    done = False
+
+    try:
+        for _ in range(num_workers):
+            processes.append(ctx.Process(
+                target=_worker,
+                args=(backend, db_path, confs, config, queue)))
+            processes[-1].daemon = True
+            processes[-1].start()
+
+        for _ in range(num_workers):
+            queue.get(timeout=60)
+
+        processes.append(ctx.Process(
+            target=_updater,
+            args=(backend, db_path, confs, config, queue, updates,
+                  interval * 2)))
+        processes[-1].daemon = True
+        processes[-1].start()
+
+        deadline = None
+
+        # Wait for pending notifications after the last update
+        while not deadline or time.time() < deadline:
+            try:
+                kind, value, applied = queue.get(timeout=interval * 2 + 60)
+
+            except Exception:
+                break
+
+            if kind == 'sent':
+                sent.add(value)
+
+            elif kind == 'applied':
+                latencies.append(applied - value)
+
+            elif kind == 'done':
+                deadline = time.time() + interval * 2 + 1
+
+            if deadline and len(latencies) >= len(sent) * num_workers:
+                break
+
+    finally:
+        for process in processes:
+            process.terminate()
+            process.join()
+
+        shutil.rmtree(tmp_dir)
+
+    result = {
+        'backend': backend,
+        'watchtype': watchtype,
+        'workers': num_workers,
+        'keys': num_keys,
+        'lost': len(sent) * num_workers - len(latencies),
+    }
+
+    if latencies:
+        result.update(common.summarize(latencies))
+
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--updates', type=int, default=20)
+    parser.add_argument('--keys', type=int, default=100)
+    parser.add_argument('--interval', type=float, default=1.0,
+                        help='WAFFLE_WATCHER_INTERVAL (seconds)')
+    parser.add_argument('--backend', action='append', choices=common.BACKENDS)
+    parser.add_argument('--watchtype', action='append',
+                        choices=['file', 'inotify', 'redis'])
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args()
+
+    results = []
+
+    for backend in args.backend or ['peewee']:
+        for watchtype in args.watchtype or ['file', 'inotify']:
+            results.append(bench(
+                backend, watchtype, args.workers, args.keys, args.updates,
+                args.interval))
+
+    common.report('propagation', results, args.json)
+
+
+if __name__ == '__main__':
+    main()
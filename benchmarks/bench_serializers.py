@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+#
+# Flask-WaffleConf - https://github.com/rmed/flask-waffleconf
+#
+# Copyright (C) 2015, 2016  Rafael Medina García <rafamedgar@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""Compare serialization formats on typical configuration payloads.
+
+Usage::
+
+    python -m benchmarks.bench_serializers [--number N] [--json results.json]
+"""
+
+from __future__ import absolute_import, print_function
+
+import argparse
+import timeit
+
+from benchmarks import common
+from flask_waffleconf import util
+
+PAYLOADS = {
+    'int': 1000,
+    'string': 'Name of the site appearing in the header',
+    'list': ['item-%d' % i for i in range(100)],
+    'dict': dict(('KEY_%d' % i, {'enabled': True, 'limit': i, 'name': 'x'})
+                 for i in range(50)),
+    'large_list': list(range(10000)),
+}
+
+FORMATS = ['pickle', 'json', 'msgpack']
+
+
+def bench(fmt, payload, number):
+    """Measure a serialization format on a payload.
+
+    Arguments:
+        fmt (str): Name of the serializer.
+        payload: Object to serialize.
+        number (int): Number of iterations.
+
+    Returns:
+        dict with the stored size (characters) and the time per
+        serialization and deserialization (microseconds).
+    """
+    stored = util.serialize(payload, fmt)
+
+    dumps = timeit.timeit(
+        lambda: util.serialize(payload, fmt), number=number)
+    loads = timeit.timeit(
+        lambda: util.deserialize(stored), number=number)
+
+    return {
+        'size': len(stored),
+        'dumps_us': dumps / number * 1e6,
+        'loads_us': loads / number * 1e6,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--number', type=int, default=2000)
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args()
+
+    results = []
+
+    for name in sorted(PAYLOADS):
+        for fmt in FORMATS:
+            if util.get_serializer(fmt).name != fmt:
+                # Not installed
+                continue
+
+            result = {'payload': name, 'format': fmt}
+            result.update(bench(fmt, PAYLOADS[name], args.number))
+            results.append(result)
+
+    common.report('serializers', results, args.json)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+#
+# Flask-WaffleConf - https://github.com/rmed/flask-waffleconf
+#
+# Copyright (C) 2015, 2016  Rafael Medina García <rafamedgar@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+"""Measure parse_conf and update_db with SQLite backed stores.
+
+Usage::
+
+    python -m benchmarks.bench_store [--repeat N] [--json results.json]
+"""
+
+from __future__ import absolute_import, print_function
+
+import argparse
+import os
+import shutil
+import tempfile
+
+from benchmarks import common
+
+# Number of keys updated at once (e.g. a form in an admin page)
+UPDATE_KEYS = 50
+
+
+def bench(backend, num_keys, value_size, repeat):
+    """Measure the extension with the given store and configuration size.
+
+    Arguments:
+        backend (str): Either 'alchemy', 'peewee' or 'sqlite3'.
+        num_keys (int): Number of configuration variables.
+        value_size (int): Approximate size of each value (in characters).
+        repeat (int): Number of times each operation is measured.
+
+    Returns:
+        list of results.
+    """
+    tmp_dir = tempfile.mkdtemp()
+
+    try:
+        confs = common.make_confs(num_keys, value_size)
+        state = common.make_state(
+            backend, os.path.join(tmp_dir, 'bench.db'), confs)
+
+        # First parse stores the default values
+        cold = common.measure(state.parse_conf, 1)
+        warm = common.measure(state.parse_conf, repeat)
+
+        keys = sorted(confs.keys())[:UPDATE_KEYS]
+        new_values = dict((key, ['updated']) for key in keys)
+        update = common.measure(lambda: state.update_db(new_values), repeat)
+
+    finally:
+        shutil.rmtree(tmp_dir)
+
+    results = []
+
+    for operation, times in (('parse_conf_cold', cold),
+                             ('parse_conf', warm),
+                             ('update_db', update)):
+        result = {
+            'backend': backend,
+            'keys': num_keys,
+            'value_size': value_size,
+            'operation': operation,
+        }
+        result.update(common.summarize(times))
+        results.append(result)
+
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--backend', action='append', choices=common.BACKENDS)
+    parser.add_argument('--keys', type=int, action='append')
+    parser.add_argument('--value-size', type=int, action='append')
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args()
+
+    results = []
+
+    for backend in args.backend or common.BACKENDS:
+        for num_keys in args.keys or common.KEY_COUNTS:
+            for value_size in args.value_size or common.VALUE_SIZES:
+                results.extend(
+                    bench(backend, num_keys, value_size, args.repeat))
+
+    common.report('store', results, args.json)
+
+
+if __name__ == '__main__':
+    main()
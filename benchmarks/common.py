@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+#
+# Flask-WaffleConf - https://github.com/rmed/flask-waffleconf
+#
+# Copyright (C) 2015, 2016  Rafael Medina García <rafamedgar@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+from __future__ import absolute_import, division
+
+import json
+import os
+import platform
+import sys
+import time
+from timeit import default_timer
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from flask import Flask
+from flask_waffleconf import WaffleConf, WaffleMixin, AlchemyWaffleStore, \
+    PeeweeWaffleStore, SQLiteWaffleStore
+
+BACKENDS = ['alchemy', 'peewee', 'sqlite3']
+KEY_COUNTS = [10, 100, 1000]
+VALUE_SIZES = [16, 1024, 16384]
+
+
+def make_confs(num_keys, value_size):
+    """Build a ``WAFFLE_CONFS`` setting.
+
+    Default values are lists of strings of roughly the given size.
+
+    Arguments:
+        num_keys (int): Number of configuration variables.
+        value_size (int): Approximate size of each value (in characters).
+
+    Returns:
+        dict to use as ``WAFFLE_CONFS``.
+    """
+    item = 'v' * min(value_size, 16)
+    value = [item] * max(1, value_size // len(item))
+
+    return dict(
+        ('BENCH_%d' % i, {'desc': 'Key %d' % i, 'default': value})
+        for i in range(num_keys))
+
+def make_state(backend, db_path, confs, config=None):
+    """Initialize the extension with a SQLite backed store.
+
+    Arguments:
+        backend (str): Either 'alchemy', 'peewee' or 'sqlite3'.
+        db_path (str): Path to the SQLite database file.
+        confs (dict): ``WAFFLE_CONFS`` setting.
+        config (dict): Additional configuration for the application.
+
+    Returns:
+        Initialized ``_WaffleState`` object.
+    """
+    app = Flask(__name__)
+    app.config['WAFFLE_CONFS'] = confs
+    app.config.update(config or {})
+
+    if backend == 'alchemy':
+        store = _alchemy_store(app, db_path)
+
+    elif backend == 'peewee':
+        store = _peewee_store(db_path)
+
+    elif backend == 'sqlite3':
+        store = SQLiteWaffleStore(db_path)
+
+    else:
+        raise ValueError('Unknown backend: %s' % backend)
+
+    return WaffleConf(app, store).state
+
+def _alchemy_store(app, db_path):
+    """Create a SQLAlchemy store.
+
+    Arguments:
+        app: Flask application instance.
+        db_path (str): Path to the SQLite database file.
+
+    Returns:
+        AlchemyWaffleStore object.
+    """
+    from flask_sqlalchemy import SQLAlchemy
+
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + db_path
+    db = SQLAlchemy(app)
+
+    class ConfModel(db.Model, WaffleMixin):
+        __tablename__ = 'confs'
+
+        id = db.Column(db.Integer, primary_key=True)
+        key = db.Column(db.String(255), unique=True)
+        value = db.Column(db.Text)
+
+    # Context is kept for the rest of the benchmark
+    app.app_context().push()
+    db.create_all()
+
+    return AlchemyWaffleStore(db, ConfModel)
+
+def _peewee_store(db_path):
+    """Create a peewee store.
+
+    Arguments:
+        db_path (str): Path to the SQLite database file.
+
+    Returns:
+        PeeweeWaffleStore object.
+    """
+    import peewee
+
+    db = peewee.SqliteDatabase(db_path)
+
+    class ConfModel(peewee.Model, WaffleMixin):
+        key = peewee.CharField(unique=True)
+        value = peewee.TextField()
+
+        class Meta:
+            database = db
+
+    db.create_tables([ConfModel], safe=True)
+
+    return PeeweeWaffleStore(db, ConfModel)
+
+def measure(func, repeat):
+    """Measure the execution time of a function.
+
+    Arguments:
+        func: Function to call (without arguments).
+        repeat (int): Number of calls.
+
+    Returns:
+        list of times (seconds).
+    """
+    times = []
+
+    for _ in range(repeat):
+        start = default_timer()
+        func()
+        times.append(default_timer() - start)
+
+    return times
+
+def percentile(values, pct):
+    """Obtain a percentile using the nearest-rank method.
+
+    Arguments:
+        values (list[float]): Measured values.
+        pct (float): Percentile (0-100).
+
+    Returns:
+        Value at the given percentile or ``None`` if there are no values.
+    """
+    if not values:
+        return None
+
+    values = sorted(values)
+    rank = int(round(pct / 100 * len(values))) - 1
+    rank = max(0, min(len(values) - 1, rank))
+
+    return values[rank]
+
+def summarize(times):
+    """Summarize measured times.
+
+    Arguments:
+        times (list[float]): Measured times (seconds).
+
+    Returns:
+        dict with the number of samples and the minimum, mean, p50 and p99
+        times (milliseconds).
+    """
+    return {
+        'samples': len(times),
+        'min_ms': min(times) * 1000,
+        'mean_ms': sum(times) / len(times) * 1000,
+        'p50_ms': percentile(times, 50) * 1000,
+        'p99_ms': percentile(times, 99) * 1000,
+    }
+
+def report(name, results, json_path=None):
+    """Print results as a table and optionally write them as JSON.
+
+    Arguments:
+        name (str): Name of the benchmark.
+        results (list[dict]): Results to report.
+        json_path (str): Path of the JSON file to write.
+    """
+    fields = []
+
+    for result in results:
+        fields.extend(f for f in result if f not in fields)
+
+    if fields:
+        print('  '.join('%14s' % f for f in fields))
+
+    for result in results:
+        print('  '.join(_format(result.get(f, '-')) for f in fields))
+
+    if json_path:
+        with open(json_path, 'w') as f:
+            json.dump({
+                'benchmark': name,
+                'timestamp': time.time(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'results': results,
+            }, f, indent=2)
+
+def _format(value):
+    """Format a value for the results table.
+
+    Arguments:
+        value: Value to format.
+
+    Returns:
+        Formatted string.
+    """
+    if isinstance(value, float):
+        return '%14.3f' % value
+
+    return '%14s' % value
@@ -22,4 +22,5 @@ from __future__ import absolute_import
 
 from .core import WaffleConf
 from .models import WaffleMixin
-from .store import WaffleStore, AlchemyWaffleStore, PeeweeWaffleStore
+from .store import WaffleStore, AlchemyWaffleStore, PeeweeWaffleStore, \
+    RedisWaffleStore, SQLiteWaffleStore, CachedWaffleStore
@@ -0,0 +1,384 @@
+# -*- coding: utf-8 -*-
+#
+# Flask-WaffleConf - https://github.com/rmed/flask-waffleconf
+#
+# Copyright (C) 2015, 2016  Rafael Medina García <rafamedgar@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+from __future__ import absolute_import
+
+from . import watcher
+import asyncio
+import os
+
+try:
+    import redis.asyncio as aioredis
+    _HAS_REDIS = True
+
+except ImportError:
+    _HAS_REDIS = False
+
+
+def get_watcher(watcher_type):
+    """Obtain a watcher coroutine function.
+
+    Arguments:
+        watcher_type (str): Either 'file', 'inotify' or 'redis'. If redis or
+            inotify are not available, it will default to file watcher.
+
+    Returns:
+        Watcher coroutine function.
+    """
+    if watcher_type == 'redis' and _HAS_REDIS:
+        return _redis_watcher
+
+    elif watcher_type == 'inotify' and watcher._HAS_INOTIFY:
+        return _inotify_watcher
+
+    else:
+        return _file_watcher
+
+def get_notifier(notifier_type):
+    """Obtain a notifier function.
+
+    Notifiers are called synchronously after updating the database. The redis
+    notifier schedules the notification in the event loop of the watcher
+    instead of waiting for it. Writing to the watch file is fast enough to be
+    done directly, so the regular file notifier is used.
+
+    Arguments:
+        notifier_type (str): Either 'file', 'inotify' or 'redis'. If redis is
+            not available, it will default to file notifier.
+
+    Returns:
+        Notifier function.
+    """
+    if notifier_type == 'redis' and _HAS_REDIS:
+        return _redis_notifier
+
+    else:
+        return watcher._file_notifier
+
+def start(state, loop=None):
+    """Start the watcher of the state as a task of the event loop.
+
+    Must be called from the thread running the loop (or before the loop is
+    started).
+
+    Arguments:
+        state (_WaffleState): Object that contains reference to app and its
+            configstore.
+        loop: Event loop to use. If not provided, the current event loop is
+            used.
+
+    Returns:
+        ``asyncio.Task`` running the watcher.
+    """
+    if loop is None:
+        loop = asyncio.get_event_loop()
+
+    state._loop = loop
+
+    return loop.create_task(state.watch(state))
+
+async def update_conf(state, keys=None, revision=None):
+    """Update configuration values from database without blocking the loop.
+
+    See :py:meth:`~flask_waffleconf.core._WaffleState.update_conf`.
+
+    Arguments:
+        state (_WaffleState): Object that contains reference to app and its
+            configstore.
+        keys (list[str]): keys that changed since the revision currently
+            loaded. If not provided, all the keys will be updated.
+        revision (int): revision the update leads to.
+    """
+    loop = asyncio.get_event_loop()
+
+    await loop.run_in_executor(None, watcher._reload, state, revision, keys)
+
+async def _try_reload(state, revision, keys):
+    """Reload config without blocking the loop, logging errors.
+
+    See :py:func:`flask_waffleconf.watcher._try_reload`.
+
+    Arguments:
+        state (_WaffleState): Object that contains reference to app and its
+            configstore.
+        revision (int): Revision the update leads to or ``None`` if unknown.
+        keys (list[str]): Keys that changed since the loaded revision or
+            ``None`` if all the keys should be reloaded.
+
+    Returns:
+        ``True`` if the config was reloaded, ``False`` otherwise.
+    """
+    loop = asyncio.get_event_loop()
+
+    return await loop.run_in_executor(
+        None, watcher._try_reload, state, revision, keys)
+
+async def _file_watcher(state):
+    """Watch for file changes and reload config when needed.
+
+    Arguments:
+        state (_WaffleState): Object that contains reference to app and its
+            configstore.
+    """
+    file_path = watcher._prepare_file(state)
+    interval = state.app.config.get('WAFFLE_WATCHER_INTERVAL', 10)
+
+    while True:
+        await _check_file(state, file_path)
+
+        # Not too critical
+        await asyncio.sleep(interval)
+
+async def _inotify_watcher(state):
+    """Wait for inotify events on the watch file and reload config when needed.
+
+    The inotify file descriptor is registered in the event loop. The file is
+    still checked every ``WAFFLE_WATCHER_INTERVAL`` seconds in case an event
+    is missed. Falls back to the file watcher if the inotify instance cannot
+    be created.
+
+    Arguments:
+        state (_WaffleState): Object that contains reference to app and its
+            configstore.
+    """
+    fd = watcher._libc.inotify_init1(
+        watcher._IN_CLOEXEC | watcher._IN_NONBLOCK)
+
+    if fd < 0:
+        return await _file_watcher(state)
+
+    file_path = watcher._prepare_file(state)
+    interval = state.app.config.get('WAFFLE_WATCHER_INTERVAL', 10)
+    wd = -1
+
+    loop = asyncio.get_event_loop()
+    readable = asyncio.Event()
+    loop.add_reader(fd, readable.set)
+
+    try:
+        while True:
+            if not os.path.isfile(file_path):
+                # Create watch file
+                open(file_path, 'a').close()
+
+            if wd < 0:
+                wd = watcher._libc.inotify_add_watch(
+                    fd, file_path.encode('utf-8'), watcher._IN_MASK)
+
+            await _check_file(state, file_path)
+
+            try:
+                await asyncio.wait_for(readable.wait(), interval)
+
+            except asyncio.TimeoutError:
+                continue
+
+            readable.clear()
+
+            try:
+                data = os.read(fd, 4096)
+
+            except BlockingIOError:
+                continue
+
+            if watcher._watch_removed(data):
+                # File was deleted or replaced, watch it again
+                wd = -1
+
+    finally:
+        loop.remove_reader(fd)
+        os.close(fd)
+
+async def _check_file(state, file_path):
+    """Check the watch file and reload config if needed.
+
+    Arguments:
+        state (_WaffleState): Object that contains reference to app and its
+            configstore.
+        file_path (str): Path to the watch file.
+    """
+    changes = watcher._file_changes(state, file_path)
+
+    if not changes:
+        return
+
+    delay = watcher._reload_delay(state)
+
+    if delay > 0:
+        await asyncio.sleep(delay)
+
+        # Include changes notified while waiting
+        changes = watcher._file_changes(state, file_path) or changes
+
+    if not await _try_reload(state, *changes):
+        # Check the file again next time
+        state._signature = None
+
+async def _redis_watcher(state):
+    """Listen to redis channel for a configuration update notifications.
+
+    Arguments:
+        state (_WaffleState): Object that contains reference to app and its
+            configstore.
+    """
+    channel = state.app.config.get('WAFFLE_REDIS_CHANNEL', 'waffleconf')
+
+    sub = _redis_client(state).pubsub(ignore_subscribe_messages=True)
+
+    try:
+        while True:
+            try:
+                await sub.subscribe(channel)
+
+                async for msg in sub.listen():
+                    # Skip non-messages
+                    if not msg['type'] == 'message':
+                        continue
+
+                    await _handle_message(state, msg['data'], sub)
+
+            except aioredis.TimeoutError:
+                # Idle longer than WAFFLE_REDIS_SOCKET_TIMEOUT
+                await sub.reset()
+
+            except aioredis.ConnectionError:
+                await sub.reset()
+                await asyncio.sleep(watcher._REDIS_RETRY_DELAY)
+
+            # Notifications may have been missed while disconnected
+            await _try_reload(state, None, None)
+
+    finally:
+        await sub.aclose()
+
+async def _handle_message(state, data, sub):
+    """Reload config according to a received notification message.
+
+    Messages received while waiting to reload or during the previous reload
+    are handled along with this one.
+
+    Arguments:
+        state (_WaffleState): Object that contains reference to app and its
+            configstore.
+        data: Raw message received.
+        sub: ``redis.asyncio.client.PubSub`` instance the message was
+            received from.
+    """
+    messages = [data]
+    delay = watcher._reload_delay(state)
+
+    if delay > 0:
+        await asyncio.sleep(delay)
+
+    while True:
+        msg = await sub.get_message(timeout=0)
+
+        if msg is None:
+            break
+
+        if msg['type'] == 'message':
+            messages.append(msg['data'])
+
+    changes = watcher._message_changes(state, messages)
+
+    if changes:
+        await _try_reload(state, *changes)
+
+def _redis_client(state):
+    """Obtain a redis client that uses the asyncio connection pool.
+
+    Arguments:
+        state (_WaffleState): Object that contains reference to app and its
+            configstore.
+
+    Returns:
+        ``redis.asyncio.StrictRedis`` instance.
+    """
+    if state._aioredis_pool is None:
+        state._aioredis_pool = watcher._redis_pool(
+            state.app.config, aioredis.ConnectionPool)
+
+    return aioredis.StrictRedis(connection_pool=state._aioredis_pool)
+
+def _redis_notifier(state, keys=None, revision=None, since=None):
+    """Notify of configuration update through redis.
+
+    The message is published from the event loop the watcher runs in. If the
+    watcher was not started, the regular notifier is used instead.
+
+    Arguments:
+        state (_WaffleState): Object that contains reference to app and its
+            configstore.
+        keys (list[str]): Keys that changed. If not provided, other processes
+            will reload all the keys.
+        revision (int): Revision of the stored configuration after the update.
+        since (int): Revision the keys changed from. Defaults to the previous
+            revision.
+    """
+    loop = getattr(state, '_loop', None)
+
+    if loop is None or loop.is_closed():
+        return watcher._redis_notifier(state, keys, revision, since)
+
+    coro = _publish(state, watcher._build_message(revision, keys, since))
+
+    try:
+        running = asyncio.get_running_loop()
+
+    except RuntimeError:
+        running = None
+
+    if running is loop:
+        task = loop.create_task(coro)
+
+    else:
+        task = asyncio.run_coroutine_threadsafe(coro, loop)
+
+    state._publishing.add(task)
+    task.add_done_callback(lambda task: _published(state, task))
+
+def _published(state, task):
+    """Forget a finished publish task, logging its error if any.
+
+    Arguments:
+        state (_WaffleState): Object that contains reference to app and its
+            configstore.
+        task: ``asyncio.Task`` or ``concurrent.futures.Future`` of the
+            publish.
+    """
+    state._publishing.discard(task)
+
+    if not task.cancelled() and task.exception() is not None:
+        state.app.logger.error(
+            'Could not publish configuration update',
+            exc_info=task.exception())
+
+async def _publish(state, message):
+    """Publish a notification message.
+
+    Arguments:
+        state (_WaffleState): Object that contains reference to app and its
+            configstore.
+        message (str): Message to publish.
+    """
+    conf = state.app.config
+
+    r = _redis_client(state)
+    await r.publish(conf.get('WAFFLE_REDIS_CHANNEL', 'waffleconf'), message)
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+#
+# Flask-WaffleConf - https://github.com/rmed/flask-waffleconf
+#
+# Copyright (C) 2015, 2016  Rafael Medina García <rafamedgar@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+from __future__ import absolute_import
+
+from . import util
+from flask import Config
+import threading
+
+
+class LazyConfig(Config):
+    """Application configuration that loads stored values on first access.
+
+    Installed by :py:class:`~flask_waffleconf.core.WaffleConf` when the
+    ``WAFFLE_LAZY`` or ``WAFFLE_LAZY_VALUES`` settings are set (see
+    :py:func:`make_lazy`).
+
+    With ``WAFFLE_LAZY``, configuration variables defined in the
+    ``WAFFLE_CONFS`` setting are only fetched from the store (and
+    deserialized) the first time they are accessed, after which the value is
+    kept like any other configuration variable until invalidated by an update
+    notification. Note that iterating over the configuration only includes the
+    values already loaded.
+
+    With ``WAFFLE_LAZY_VALUES``, large values are kept serialized (see
+    :py:class:`~flask_waffleconf.util.LazyValue`) and deserialized when first
+    accessed through the mapping interface (``config[key]``, ``get()``,
+    ``items()`` and ``values()``).
+
+    Arguments:
+        root_path (str): path to which files are read relative from.
+        defaults (dict): initial configuration values.
+        state (_WaffleState): state used to load stored values.
+    """
+
+    def __init__(self, root_path, defaults=None, state=None):
+        super(LazyConfig, self).__init__(root_path, defaults)
+
+        self.state = state
+
+        # Values loaded before an invalidation are discarded
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def __getitem__(self, key):
+        value = super(LazyConfig, self).__getitem__(key)
+
+        if isinstance(value, util.LazyValue):
+            holder = value
+            value = holder.get()
+
+            with self._lock:
+                # Keep the deserialized value unless it changed meanwhile
+                if dict.get(self, key) is holder:
+                    dict.__setitem__(self, key, value)
+
+        return value
+
+    def __missing__(self, key):
+        if not self._is_lazy(key):
+            raise KeyError(key)
+
+        generation = self._generation
+
+        # Reading must not write to the database (e.g. committing the session
+        # of the request): default values are stored by parse_conf()
+        value = self.state._load_conf([key], store_missing=False)[0][key]
+
+        with self._lock:
+            if generation == self._generation:
+                dict.__setitem__(self, key, value)
+
+        return value
+
+    def __contains__(self, key):
+        return dict.__contains__(self, key) or self._is_lazy(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+
+        except KeyError:
+            return default
+
+    def items(self):
+        return [(key, self[key]) for key in list(self.keys())]
+
+    def values(self):
+        return [self[key] for key in list(self.keys())]
+
+    def invalidate(self, keys=None):
+        """Discard loaded values so that they are loaded again when accessed.
+
+        Arguments:
+            keys (list[str]): names of the configuration variables to discard.
+                If not provided, all the stored variables are discarded.
+
+        Returns:
+            dict of the values discarded.
+        """
+        keys = self.state._valid_keys(keys)
+        discarded = {}
+
+        with self._lock:
+            self._generation += 1
+
+            for key in keys:
+                if dict.__contains__(self, key):
+                    discarded[key] = self.pop(key)
+
+        return discarded
+
+    def _is_lazy(self, key):
+        """Check whether a configuration variable can be loaded from the store.
+
+        Arguments:
+            key (str): name of the configuration variable.
+
+        Returns:
+            ``True`` if the variable is defined in ``WAFFLE_CONFS``.
+        """
+        if self.state is None or not self.state.lazy:
+            return False
+
+        if key.startswith('WAFFLE_'):
+            return False
+
+        return key in dict.get(self, 'WAFFLE_CONFS', {})
+
+
+def make_lazy(config, state):
+    """Make an existing configuration load stored values on first access.
+
+    The class of the object is changed in place instead of replacing
+    ``app.config``, as references to the configuration may already be held
+    elsewhere (e.g. the ``config`` global of the Jinja environment).
+
+    Arguments:
+        config (Config): configuration of the application.
+        state (_WaffleState): state used to load stored values.
+
+    Returns:
+        The same configuration object, now a :py:class:`LazyConfig`.
+    """
+    cls = type(config)
+
+    if not issubclass(cls, LazyConfig):
+        if cls is not Config:
+            # Keep the behaviour of custom configuration classes
+            cls = type('Lazy' + cls.__name__, (LazyConfig, cls), {})
+
+        else:
+            cls = LazyConfig
+
+        config.__class__ = cls
+
+    config.state = state
+    config._generation = 0
+    config._lock = threading.Lock()
+
+    return config
@@ -20,11 +20,68 @@
 
 from __future__ import absolute_import
 
+from . import config
+from . import signals
+from . import snapshot
 from . import util
 from . import watcher
+from timeit import default_timer
+import atexit
+import contextlib
 import threading
 import time
 
+try:
+    from concurrent.futures import ThreadPoolExecutor
+    _HAS_FUTURES = True
+
+except ImportError:
+    _HAS_FUTURES = False
+
+try:
+    from types import MappingProxyType
+
+except ImportError:
+    # Python 2: snapshots are plain dicts (must not be modified)
+    MappingProxyType = dict
+
+# Value of configuration variables that were not loaded
+_MISSING = object()
+
+def _merge_pending(pending, update):
+    """Merge an update into a notification that was not sent yet.
+
+    Arguments:
+        pending (dict): pending notification, or ``None`` if there is none.
+        update (dict): update to merge, with the revision it changed from
+            (``since``), the revision it leads to (``revision``) and the keys
+            that changed (``keys``, ``None`` if unknown).
+
+    Returns:
+        dict of the merged notification.
+    """
+    keys = update['keys']
+    update = dict(update, keys=None if keys is None else set(keys))
+
+    if pending is None:
+        return update
+
+    first, second = sorted((pending, update), key=lambda p: p['since'])
+
+    if first['keys'] is None or second['keys'] is None or \
+            second['since'] > first['revision']:
+        # Other processes updated keys in between
+        keys = None
+
+    else:
+        keys = first['keys'] | second['keys']
+
+    return {
+        'since': first['since'],
+        'revision': max(first['revision'], second['revision']),
+        'keys': keys
+    }
+
 
 class _WaffleState(object):
     """Store configstore for the app state.
@@ -42,18 +99,120 @@ class _WaffleState(object):
         self.app = app
         self.configstore = configstore
 
+        # Revision of the stored configuration currently loaded
+        self._revision = None
+
+        # Load values when first accessed (see LazyConfig)
+        self.lazy = self.app.config.get('WAFFLE_LAZY', False)
+
+        # Minimum size of values that are deserialized when first accessed
+        self.lazy_values = self.app.config.get('WAFFLE_LAZY_VALUES', 0)
+
+        # Publish values in immutable snapshots (see snapshot())
+        self.swap = (
+            self.app.config.get('WAFFLE_SNAPSHOT_SWAP', False) and
+            not self.lazy)
+        self._snapshot = MappingProxyType({})
+        self._swap_lock = threading.Lock()
+
+        # Format used when writing values
+        self.serializer = self.app.config.get('WAFFLE_SERIALIZER', 'pickle')
+        self.compress = self.app.config.get('WAFFLE_COMPRESS_THRESHOLD', 0)
+        self.compression = self.app.config.get('WAFFLE_COMPRESSION', 'zlib')
+
+        # Avoid deserializing unchanged values again
+        cache_size = self.app.config.get('WAFFLE_DESERIALIZE_CACHE', 0)
+
+        if cache_size:
+            self.deserialize_cache = util.DeserializeCache(cache_size)
+            self._deserialize = self.deserialize_cache.deserialize
+
+        else:
+            self.deserialize_cache = None
+            self._deserialize = util.deserialize
+
+        # Cumulative counters
+        self._stats = {}
+        self._stats_lock = threading.Lock()
+
+        # Event loop of the asynchronous watcher and notifications being
+        # published from it (tasks are only weakly referenced by the loop)
+        self._loop = None
+        self._publishing = set()
+
+        # Time of the last reload requested by other processes
+        self._last_reload = None
+
+        # Functions called when values change (see on_change())
+        self._callbacks = []
+        self._callbacks_lock = threading.Lock()
+        self._executor = None
+
+        # Redis connection pools shared by watcher and notifier
+        self._redis_pool = None
+        self._aioredis_pool = None
+
+        # Notification of updates not sent yet (see batch())
+        self._pending = None
+        self._notify_lock = threading.Lock()
+        self._notify_timer = None
+
+        # Depth and pending updates of the batch() block of each thread
+        self._batch = threading.local()
+
         # Setup multiprocess notifications
         if self.app.config.get('WAFFLE_MULTIPROC', False):
             op_type = self.app.config.get('WAFFLE_WATCHTYPE', 'file')
+            asynchronous = self.app.config.get('WAFFLE_ASYNC', False)
+
+            self.watch = watcher.get_watcher(op_type, asynchronous)
+            self.notify = watcher.get_notifier(op_type, asynchronous)
 
-            self.watch = watcher.get_watcher(op_type)
-            self.notify = watcher.get_notifier(op_type)
+            if asynchronous:
+                # Started in the event loop with start_watcher()
+                self._watcher = None
 
-            self._tstamp = time.time()
+            elif self.app.config.get('WAFFLE_SHARED_WATCHER', False):
+                # Threads shared by all the applications of the process
+                self._watcher = watcher.get_hub().register(self)
 
-            self._watcher = threading.Thread(target=self.watch, args=(self,))
-            self._watcher.setDaemon(True)
-            self._watcher.start()
+            else:
+                self._watcher = threading.Thread(
+                    target=self.watch, args=(self,))
+                self._watcher.daemon = True
+                self._watcher.start()
+
+            if self.app.config.get('WAFFLE_NOTIFY_WINDOW', 0):
+                # Do not lose the last notification when exiting
+                atexit.register(self._flush_in_context)
+
+        # Boot from the local snapshot and reconcile with the store later
+        if self.app.config.get('WAFFLE_SNAPSHOT_FILE') and not self.lazy:
+            self._boot_snapshot()
+
+            self._reconciler = threading.Thread(target=self._reconcile)
+            self._reconciler.daemon = True
+            self._reconciler.start()
+
+    def start_watcher(self, loop=None):
+        """Start the asynchronous watcher in the event loop.
+
+        Only used when the ``WAFFLE_ASYNC`` setting is set, as otherwise the
+        watcher runs in its own thread. Must be called from the thread that
+        runs the loop (e.g. in a ``before_serving`` function in Quart).
+
+        Arguments:
+            loop: Event loop to use. If not provided, the current event loop
+                is used.
+
+        Returns:
+            ``asyncio.Task`` running the watcher.
+        """
+        from . import aiowatcher
+
+        self._watcher = aiowatcher.start(self, loop)
+
+        return self._watcher
 
     def parse_conf(self, keys=[]):
         """Parse configuration values from the database.
@@ -70,42 +229,281 @@ class _WaffleState(object):
         Returns:
             dict of the parsed config values.
         """
+        return self._load_conf(keys)[0]
+
+    def _load_conf(self, keys=None, lazy=False, store_missing=True):
+        """Parse configuration values from the database.
+
+        See :py:meth:`parse_conf`.
+
+        Arguments:
+            keys (list[str]): list of keys to parse. If not provided, all the
+                keys known to the application will be used.
+            lazy (bool): whether large values are returned as
+                :py:class:`~flask_waffleconf.util.LazyValue` instances (see
+                :py:meth:`_parse_stored`).
+            store_missing (bool): whether to store the default value of the
+                keys not found in the database.
+
+        Returns:
+            tuple with the dict of parsed config values and the dict of their
+            stored (serialized) values.
+        """
+        start = default_timer()
+        keys = self._valid_keys(keys)
+
+        if not keys:
+            return {}, {}
+
+        # Obtain all the stored records at once
+        stored_confs = self._call_store('get_many', keys)
+        stored = dict(
+            (key, record.get_value()) for key, record in stored_confs.items())
+
+        result = self._parse_stored(stored, keys, lazy)
+
+        # Store new records in database
+        missing = dict(
+            (key, self._serialize(result[key]))
+            for key in keys if key not in stored and store_missing)
+
+        if missing:
+            # Store all the new records in a single batch
+            self._call_store('put_many', missing)
+            self._call_store('commit')
+
+        self._record(
+            'parse_conf', signals.conf_parsed, start, keys=len(keys),
+            size=sum(len(v) for v in stored.values()))
+
+        stored.update(missing)
+
+        return result, stored
+
+    def _valid_keys(self, keys=None):
+        """Filter the keys that can be parsed.
+
+        Arguments:
+            keys (list[str]): list of keys to filter. If not provided, all the
+                keys known to the application will be used.
+
+        Returns:
+            list of keys defined in the ``WAFFLE_CONFS`` setting.
+        """
         confs = self.app.config.get('WAFFLE_CONFS', {})
         if not keys:
             keys = confs.keys()
 
-        result = {}
+        # Some things cannot be changed and no arbitrary keys are allowed
+        return [k for k in keys if not k.startswith('WAFFLE_') and k in confs]
 
-        for key in keys:
-            # Some things cannot be changed...
-            if key.startswith('WAFFLE_'):
-                continue
+    def _parse_stored(self, stored, keys, lazy=False):
+        """Deserialize stored values.
 
-            # No arbitrary keys
-            if key not in confs.keys():
-                continue
+        Keys that are not stored will use their default value.
 
-            stored_conf = self.configstore.get(key)
+        Arguments:
+            stored (dict): stored (serialized) values.
+            keys (list[str]): list of keys to parse.
+            lazy (bool): whether values of at least ``WAFFLE_LAZY_VALUES``
+                characters are returned as
+                :py:class:`~flask_waffleconf.util.LazyValue` instances
+                (only for values stored in the application configuration).
 
-            if not stored_conf:
-                # Store new record in database
-                value = confs[key].get('default', '')
-                stored_conf = self.configstore.put(key, util.serialize(value))
-                self.configstore.commit()
+        Returns:
+            dict of the parsed config values.
+        """
+        confs = self.app.config.get('WAFFLE_CONFS', {})
+        result = {}
 
-            else:
+        for key in keys:
+            if key in stored:
                 # Get stored value
-                value = util.deserialize(stored_conf.get_value())
+                if lazy and self.lazy_values and \
+                        len(stored[key]) >= self.lazy_values:
+                    result[key] = util.LazyValue(
+                        stored[key], self._deserialize)
+
+                else:
+                    result[key] = self._deserialize(stored[key])
 
-            result[stored_conf.get_key()] = value
+            else:
+                result[key] = confs[key].get('default', '')
 
         return result
 
+    def _parse_shared(self, revision, keys=None):
+        """Parse values from the shared snapshot.
+
+        Arguments:
+            revision (int): minimum revision the snapshot must contain.
+            keys (list[str]): list of keys to parse. If not provided, all the
+                keys known to the application will be used.
+
+        Returns:
+            tuple with the revision of the snapshot and dict of the parsed
+            config values, or ``None`` if the shared snapshot is disabled,
+            missing or outdated.
+        """
+        path = self.app.config.get('WAFFLE_SHARED_SNAPSHOT')
+
+        if not path or revision is None:
+            return None
+
+        loaded = snapshot.read(path)
+
+        if not loaded or loaded[0] < revision:
+            return None
+
+        shared_revision, stored = loaded
+
+        return shared_revision, self._parse_stored(
+            stored, self._valid_keys(keys), True)
+
+    def _write_shared(self, revision):
+        """Write the shared snapshot for other processes.
+
+        Arguments:
+            revision (int): revision of the stored configuration.
+        """
+        path = self.app.config.get('WAFFLE_SHARED_SNAPSHOT')
+
+        if not path:
+            return
+
+        current = snapshot.read_revision(path)
+
+        if current is not None and current >= revision:
+            # Do not overwrite a newer snapshot
+            return
+
+        # Cached records may be older than the revision (e.g. waiting for
+        # the reload delay of a notification), read them from the database
+        self.configstore.invalidate()
+        stored_confs = self._call_store('get_many', self._valid_keys())
+
+        try:
+            snapshot.write(path, revision, dict(
+                (key, record.get_value())
+                for key, record in stored_confs.items()))
+
+        except (IOError, OSError):
+            # Other processes read the values from the database instead
+            self.app.logger.warning(
+                'Could not write shared configuration snapshot',
+                exc_info=True)
+
+    def _serialize(self, value):
+        """Serialize a value according to the configuration.
+
+        Arguments:
+            value: value to serialize.
+
+        Returns:
+            Serialized value.
+        """
+        return util.serialize(
+            value, self.serializer, self.compress, self.compression)
+
+    def _boot_snapshot(self):
+        """Load configuration values from the local snapshot.
+
+        The revision of the snapshot is only considered loaded if it contains
+        all the keys known to the application, so that new keys are parsed
+        from the database when reconciling.
+
+        Returns:
+            ``True`` if the snapshot was loaded, ``False`` otherwise.
+        """
+        local = snapshot.read(self.app.config.get('WAFFLE_SNAPSHOT_FILE'))
+
+        if not local:
+            return False
+
+        revision, stored = local
+        keys = self._valid_keys()
+        stored = dict((k, v) for k, v in stored.items() if k in keys)
+
+        parsed = self._parse_stored(stored, stored.keys(), True)
+        self._swap(parsed)
+        self.app.config.update(parsed)
+
+        if len(stored) == len(keys):
+            self._revision = revision
+
+        return True
+
+    def _reconcile(self):
+        """Update configuration values from database until it succeeds.
+
+        Executed in a separate thread after booting from the local snapshot,
+        retrying every ``WAFFLE_SNAPSHOT_RETRY`` seconds while the database is
+        not available.
+        """
+        delay = self.app.config.get('WAFFLE_SNAPSHOT_RETRY', 5)
+
+        while True:
+            try:
+                with self.app.app_context():
+                    self.update_conf()
+
+                return
+
+            except Exception:
+                self.app.logger.warning(
+                    'Could not load configuration from the database, '
+                    'retrying in %s seconds', delay, exc_info=True)
+
+            time.sleep(delay)
+
+    def _write_local(self, revision, stored, since=None):
+        """Write the local snapshot.
+
+        Arguments:
+            revision (int): revision of the stored configuration.
+            stored (dict): stored (serialized) values.
+            since (int): revision the values changed from. If provided, the
+                values are merged with those of the current snapshot, which
+                must have this revision. Otherwise, ``stored`` must contain
+                all the keys.
+        """
+        path = self.app.config.get('WAFFLE_SNAPSHOT_FILE')
+
+        if not path or revision is None:
+            return
+
+        current = snapshot.read(path)
+
+        if current and current[0] >= revision:
+            # Do not overwrite a newer snapshot
+            return
+
+        if since is not None:
+            if not current or current[0] != since:
+                # Written again on the next full update
+                return
+
+            values = current[1]
+            values.update(stored)
+
+        else:
+            values = stored
+
+        try:
+            snapshot.write(path, revision, values)
+
+        except (IOError, OSError):
+            self.app.logger.warning(
+                'Could not write configuration snapshot', exc_info=True)
+
     def update_db(self, new_values):
         """Update database values and application configuration.
 
         The provided keys must be defined in the ``WAFFLE_CONFS`` setting.
 
+        All the values are written in a single transaction: if any of the
+        writes fails, none of the values are updated.
+
         Arguments:
             new_values (dict): dict of configuration variables and their values
                 The dict has the following structure:
@@ -115,6 +513,7 @@ class _WaffleState(object):
                     'MY_CONFIG_VAR1' : <CONFIG_VAL1>
                 }
         """
+        start = default_timer()
         confs = self.app.config.get('WAFFLE_CONFS', {})
         to_update = {}
 
@@ -127,34 +526,535 @@ class _WaffleState(object):
             if key not in confs.keys():
                 continue
 
-            value = new_values[key]
-            self.configstore.put(key, util.serialize(value))
-            self.configstore.commit()
-
-            to_update[key] = value
+            to_update[key] = new_values[key]
 
-        # Update config
         if not to_update:
             return
 
-        self.app.config.update(to_update)
+        # Write all the values in a single transaction
+        serialized = dict(
+            (key, self._serialize(value))
+            for key, value in to_update.items())
+
+        with self._store_transaction():
+            self._call_store('put_many', serialized)
+            revision = self._call_store('bump_revision')
+
+        if self._revision == revision - 1:
+            # Otherwise, some other update has not been loaded yet
+            self._revision = revision
+
+        self._write_local(revision, serialized, revision - 1)
+
+        # Update config
+        self._apply(to_update)
 
         # Notify other processes
         if self.app.config.get('WAFFLE_MULTIPROC', False):
-            self.notify(self)
+            self._queue_notification(to_update.keys(), revision)
+
+        self._record(
+            'update_db', signals.db_updated, start, keys=len(to_update))
+
+    @contextlib.contextmanager
+    def batch(self):
+        """Send a single notification for all the updates made in the block.
+
+        Updates are still written to the database (and applied to the
+        application) right away, but other processes are only notified when
+        the outermost ``batch()`` block exits. Only the updates made by the
+        current thread are held back.
+
+        Example::
+
+            with state.batch():
+                for key, value in values:
+                    state.update_db({key: value})
+        """
+        batch = self._batch
+        batch.depth = getattr(batch, 'depth', 0) + 1
 
-    def update_conf(self):
+        if batch.depth == 1:
+            batch.pending = None
+
+        try:
+            yield self
+
+        finally:
+            batch.depth -= 1
+
+            if not batch.depth and batch.pending is not None:
+                with self._notify_lock:
+                    self._pending = _merge_pending(
+                        self._pending, batch.pending)
+
+                batch.pending = None
+                self.flush()
+
+    def flush(self):
+        """Notify other processes of the pending updates, if any.
+
+        Pending updates are sent in a single notification that includes all
+        the keys that changed.
+        """
+        with self._notify_lock:
+            pending = self._pending
+            self._pending = None
+
+            if self._notify_timer is not None:
+                self._notify_timer.cancel()
+                self._notify_timer = None
+
+        if pending is None:
+            return
+
+        keys = pending['keys']
+
+        try:
+            self._write_shared(pending['revision'])
+
+        finally:
+            # Values were already stored, other processes must know
+            self.notify(
+                self, None if keys is None else list(keys),
+                pending['revision'], pending['since'])
+
+    def _queue_notification(self, keys, revision):
+        """Add an update to the pending notification.
+
+        The notification is sent right away unless inside a :py:meth:`batch`
+        block or the ``WAFFLE_NOTIFY_WINDOW`` setting is set, in which case it
+        is sent when the block exits or the window closes.
+
+        Arguments:
+            keys (list[str]): keys that changed.
+            revision (int): revision of the stored configuration after the
+                update.
+        """
+        window = self.app.config.get('WAFFLE_NOTIFY_WINDOW', 0)
+        update = {'since': revision - 1, 'revision': revision, 'keys': keys}
+        batch = self._batch
+
+        if getattr(batch, 'depth', 0):
+            # Sent when the block of this thread exits
+            batch.pending = _merge_pending(batch.pending, update)
+            return
+
+        with self._notify_lock:
+            self._pending = _merge_pending(self._pending, update)
+
+            if window:
+                if self._notify_timer is None:
+                    self._notify_timer = threading.Timer(
+                        window, self._flush_in_context)
+                    self._notify_timer.daemon = True
+                    self._notify_timer.start()
+
+                return
+
+        self.flush()
+
+    def _flush_in_context(self):
+        """Send the pending notification from outside of a request.
+
+        Stores may require an application context to write the shared
+        snapshot.
+        """
+        with self.app.app_context():
+            self.flush()
+
+    def update_conf(self, keys=None, revision=None):
         """Update configuration values from database.
 
         This method should be called when there is an update notification.
+
+        When updating all the keys, nothing is done if the revision of the
+        stored configuration matches the one currently loaded.
+
+        If ``WAFFLE_SHARED_SNAPSHOT`` is set and the snapshot already contains
+        the given revision, values are parsed from the snapshot instead of
+        querying the database.
+
+        If ``WAFFLE_LAZY`` is set, the values are discarded instead, so that
+        they are loaded again when accessed.
+
+        Values read from the database are written to the local snapshot if
+        ``WAFFLE_SNAPSHOT_FILE`` is set.
+
+        Arguments:
+            keys (list[str]): keys that changed since the revision currently
+                loaded. If not provided, all the keys known to the application
+                will be updated.
+            revision (int): revision the update leads to. Required in order
+                to update only the given keys.
         """
-        parsed = self.parse_conf()
+        start = default_timer()
 
-        if not parsed:
-            return None
+        if keys and revision is not None and self._revision is not None:
+            self.configstore.invalidate(keys)
+            shared = None if self.lazy else self._parse_shared(revision, keys)
 
-        # Update app config
-        self.app.config.update(parsed)
+            if shared:
+                parsed = shared[1]
+
+            elif self.lazy:
+                self._invalidate(keys)
+                parsed = {}
+
+            else:
+                parsed, stored = self._load_conf(keys, True)
+                self._write_local(revision, stored, self._revision)
+
+            self._revision = max(self._revision, revision)
+
+        else:
+            shared = None if self.lazy else self._parse_shared(revision)
+
+            if shared:
+                revision, parsed = shared
+
+                # Records cached by the store are outdated as well
+                self.configstore.invalidate()
+
+            else:
+                revision = self._call_store('get_revision')
+
+                if revision == self._revision:
+                    self._record(
+                        'update_conf', signals.conf_updated, start, keys=0)
+                    return None
+
+                self.configstore.invalidate()
+
+                if self.lazy:
+                    self._invalidate()
+                    parsed = {}
+
+                else:
+                    parsed, stored = self._load_conf(lazy=True)
+                    self._write_local(revision, stored)
+
+            self._revision = revision
+
+        if parsed:
+            # Update app config
+            self._apply(parsed)
+
+        self._record(
+            'update_conf', signals.conf_updated, start, keys=len(parsed))
+
+    def on_change(self, key, callback=None):
+        """Register a function to call when a configuration value changes.
+
+        The function is called with the name of the configuration variable,
+        its previous value (``None`` if it was not loaded) and its new value,
+        only when the new value is different. Functions are called in the
+        thread that updated the configuration, unless the
+        ``WAFFLE_CALLBACK_WORKERS`` setting is set.
+
+        Can also be used as a decorator::
+
+            @state.on_change('RATE_LIMIT')
+            def rebuild_limiter(key, old, new):
+                ...
+
+        Arguments:
+            key (str): name of the configuration variable. A trailing ``*``
+                matches all the variables that start with the given prefix
+                (e.g. ``'MAIL_*'``).
+            callback: function to call. If not provided, a decorator is
+                returned.
+
+        Returns:
+            The function registered.
+        """
+        if callback is None:
+            return lambda f: self.on_change(key, f)
+
+        with self._callbacks_lock:
+            self._callbacks.append((key, callback))
+
+        return callback
+
+    def _apply(self, values):
+        """Update the application configuration.
+
+        Functions registered with :py:meth:`on_change` are called for the
+        values that changed.
+
+        Arguments:
+            values (dict): new configuration values.
+        """
+        changes = []
+
+        if self._callbacks:
+            for key, value in values.items():
+                if not self._callbacks_for(key):
+                    continue
+
+                # Do not load lazy values
+                old = dict.get(self.app.config, key, _MISSING)
+
+                if old is _MISSING:
+                    changes.append((key, None, value))
+
+                elif old != value:
+                    changes.append((key, old, value))
+
+        self._swap(values)
+        self.app.config.update(values)
+        self._dispatch(changes)
+
+    def _swap(self, values):
+        """Publish a new snapshot that includes the given values.
+
+        The new snapshot is built from a copy of the current one and then
+        replaced with a single assignment, so readers never see a partially
+        applied update. Does nothing unless ``WAFFLE_SNAPSHOT_SWAP`` is set.
+
+        Arguments:
+            values (dict): new configuration values.
+        """
+        if not self.swap:
+            return
+
+        # Values in the snapshot cannot be replaced when first accessed
+        values = dict(
+            (key, value.get() if isinstance(value, util.LazyValue) else value)
+            for key, value in values.items())
+
+        # Serialize writers, readers do not need the lock
+        with self._swap_lock:
+            current = dict(self._snapshot)
+            current.update(values)
+            self._snapshot = MappingProxyType(current)
+
+    def snapshot(self):
+        """Obtain a consistent, read-only view of the configuration values.
+
+        If ``WAFFLE_SNAPSHOT_SWAP`` is set, the returned mapping is never
+        modified: updates publish a new one instead, so the values obtained
+        from it always belong to the same update (call this method again to
+        obtain the latest values). No lock is needed to read it.
+
+        Otherwise, a copy of the current values is built on each call, which
+        may include values of an update that is still being applied.
+
+        Example::
+
+            conf = state.snapshot()
+
+            if conf['FEATURE_ENABLED']:
+                limit = conf['FEATURE_LIMIT']
+
+        Returns:
+            read-only mapping of the configuration variables defined in the
+            ``WAFFLE_CONFS`` setting to their values.
+        """
+        if self.swap:
+            return self._snapshot
+
+        config = self.app.config
+
+        return MappingProxyType(dict(
+            (key, config[key]) for key in self._valid_keys()
+            if key in config))
+
+    def _invalidate(self, keys=None):
+        """Discard lazily loaded values.
+
+        Values watched with :py:meth:`on_change` are loaded again right away
+        in order to check whether they changed.
+
+        Arguments:
+            keys (list[str]): keys to discard. If not provided, all the keys
+                known to the application are discarded.
+        """
+        discarded = self.app.config.invalidate(keys)
+        changes = []
+
+        for key, old in discarded.items():
+            if not self._callbacks_for(key):
+                continue
+
+            value = self.app.config[key]
+
+            if old != value:
+                changes.append((key, old, value))
+
+        self._dispatch(changes)
+
+    def _callbacks_for(self, key):
+        """Obtain the functions registered for a configuration variable.
+
+        Arguments:
+            key (str): name of the configuration variable.
+
+        Returns:
+            list of functions.
+        """
+        with self._callbacks_lock:
+            callbacks = list(self._callbacks)
+
+        return [
+            callback for pattern, callback in callbacks
+            if pattern == key or (
+                pattern.endswith('*') and key.startswith(pattern[:-1]))]
+
+    def _dispatch(self, changes):
+        """Call the functions registered for the values that changed.
+
+        Arguments:
+            changes (list[tuple]): name, previous value and new value of each
+                configuration variable that changed.
+        """
+        workers = self.app.config.get('WAFFLE_CALLBACK_WORKERS', 0)
+
+        if workers and _HAS_FUTURES and self._executor is None:
+            with self._callbacks_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(workers)
+
+        for key, old, value in changes:
+            if isinstance(old, util.LazyValue):
+                old = old.get()
+
+            if isinstance(value, util.LazyValue):
+                value = value.get()
+
+            for callback in self._callbacks_for(key):
+                if self._executor is not None:
+                    self._executor.submit(
+                        self._call_callback, callback, key, old, value)
+
+                else:
+                    self._call_callback(callback, key, old, value)
+
+    def _call_callback(self, callback, key, old, value):
+        """Call a function registered with :py:meth:`on_change`.
+
+        Exceptions are logged so that they do not interrupt the update.
+
+        Arguments:
+            callback: function to call.
+            key (str): name of the configuration variable.
+            old: previous value.
+            value: new value.
+        """
+        try:
+            callback(key, old, value)
+
+        except Exception:
+            self.app.logger.exception(
+                'Error in change callback for %s', key)
+
+    def update_conf_async(self, keys=None, revision=None):
+        """Update configuration values from database in an executor.
+
+        Same as :py:meth:`update_conf`, but store operations are executed
+        in the default executor of the event loop.
+
+        Arguments:
+            keys (list[str]): keys that changed since the revision currently
+                loaded.
+            revision (int): revision the update leads to.
+
+        Returns:
+            Coroutine to await.
+        """
+        from . import aiowatcher
+
+        return aiowatcher.update_conf(self, keys, revision)
+
+    def stats(self):
+        """Obtain cumulative counters of the operations performed.
+
+        Returns:
+            dict mapping the name of each operation (``'parse_conf'``,
+            ``'update_db'``, ``'update_conf'``, ``'store.<method>'`` and
+            ``'watcher.<source>'``) to a dict with the number of ``calls``,
+            total ``seconds`` spent and, where applicable, total number of
+            ``keys`` and ``size`` of deserialized values. If the
+            deserialization cache is enabled, its ``hits`` and ``misses``
+            are included under ``'deserialize_cache'``.
+        """
+        with self._stats_lock:
+            result = dict((k, dict(v)) for k, v in self._stats.items())
+
+        if self.deserialize_cache is not None:
+            result['deserialize_cache'] = {
+                'hits': self.deserialize_cache.hits,
+                'misses': self.deserialize_cache.misses,
+            }
+
+        return result
+
+    def _record(self, name, signal, start, extra=None, **counters):
+        """Update counters and send the signal of an operation.
+
+        Arguments:
+            name (str): name of the operation.
+            signal: signal to send.
+            start (float): time at which the operation started.
+            extra (dict): additional arguments for the signal.
+            counters: additional counters (e.g. ``keys``, ``size``).
+        """
+        duration = default_timer() - start
+
+        with self._stats_lock:
+            stats = self._stats.setdefault(name, {'calls': 0, 'seconds': 0})
+            stats['calls'] += 1
+            stats['seconds'] += duration
+
+            for counter, value in counters.items():
+                stats[counter] = stats.get(counter, 0) + value
+
+        counters.update(extra or {})
+        signal.send(self.app, state=self, duration=duration, **counters)
+
+    def _call_store(self, operation, *args):
+        """Call a method of the store, measuring its duration.
+
+        Arguments:
+            operation (str): name of the method.
+            args: arguments for the method.
+
+        Returns:
+            Result of the method.
+        """
+        start = default_timer()
+
+        try:
+            return getattr(self.configstore, operation)(*args)
+
+        finally:
+            self._record(
+                'store.' + operation, signals.store_called, start,
+                {'operation': operation})
+
+    @contextlib.contextmanager
+    def _store_transaction(self):
+        """Run a transaction of the store, measuring its duration."""
+        start = default_timer()
+
+        try:
+            with self.configstore.transaction():
+                yield
+
+        finally:
+            self._record(
+                'store.transaction', signals.store_called, start,
+                {'operation': 'transaction'})
+
+    def _wakeup(self, source):
+        """Record a watcher wakeup.
+
+        Arguments:
+            source (str): name of the watcher.
+        """
+        self._record(
+            'watcher.' + source, signals.watcher_woken, default_timer(),
+            {'source': source})
 
 
 class WaffleConf(object):
@@ -190,3 +1090,7 @@ class WaffleConf(object):
 
         self.state = _WaffleState(app, configstore)
         app.extensions['waffleconf'] = self.state
+
+        if self.state.lazy or self.state.lazy_values:
+            # Load stored values when first accessed
+            config.make_lazy(app.config, self.state)
@@ -30,6 +30,9 @@ class WaffleMixin(object):
     Values may be a large string, so make sure to define a field capable
     of storing big strings. These values are later parsed according to the
     ``type`` specified in the application configuration.
+
+    The ``WAFFLE_REVISION`` key is reserved for storing the revision of the
+    configuration, which is increased on every update.
     """
 
     def get_key(self):
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+#
+# Flask-WaffleConf - https://github.com/rmed/flask-waffleconf
+#
+# Copyright (C) 2015, 2016  Rafael Medina García <rafamedgar@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+from flask.signals import Namespace
+
+_signals = Namespace()
+
+# All the signals are sent with the application as sender and the following
+# keyword arguments:
+#
+#   - state (_WaffleState): state object that sent the signal.
+#   - duration (float): seconds taken by the operation.
+#
+# Additional arguments are documented for each signal.
+
+# Sent after parsing values with ``parse_conf()``. Also sent with ``keys``
+# (number of keys parsed) and ``size`` (characters deserialized).
+conf_parsed = _signals.signal('waffleconf-conf-parsed')
+
+# Sent after updating values with ``update_db()``. Also sent with ``keys``
+# (number of keys updated).
+db_updated = _signals.signal('waffleconf-db-updated')
+
+# Sent after reloading values with ``update_conf()``. Also sent with ``keys``
+# (number of keys reloaded).
+conf_updated = _signals.signal('waffleconf-conf-updated')
+
+# Sent after each call to the store. Also sent with ``operation`` (name of
+# the method called, e.g. ``'get_many'``).
+store_called = _signals.signal('waffleconf-store-called')
+
+# Sent each time a watcher checks for updates. Also sent with ``source`` (name
+# of the watcher, e.g. ``'file'``). The duration is always ``0``.
+watcher_woken = _signals.signal('waffleconf-watcher-woken')
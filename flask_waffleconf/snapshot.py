@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+#
+# Flask-WaffleConf - https://github.com/rmed/flask-waffleconf
+#
+# Copyright (C) 2015, 2016  Rafael Medina García <rafamedgar@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import json
+import mmap
+import os
+import struct
+import threading
+import zlib
+
+# Snapshot files consist of a fixed-size header followed by a JSON payload
+# that maps configuration keys to their stored (serialized) values. The header
+# contains the revision, so that it can be checked without reading the whole
+# file, and a checksum of the payload.
+_MAGIC = b'WAFS'
+
+# Magic, revision, payload length and CRC32 of the payload
+_HEADER = struct.Struct('<4sQQI')
+
+
+def read(path):
+    """Read a snapshot file.
+
+    Arguments:
+        path (str): Path to the snapshot file.
+
+    Returns:
+        tuple with the revision and the dict of stored values, or ``None`` if
+        the file does not exist or is not a valid snapshot.
+    """
+    try:
+        with open(path, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    except (IOError, OSError, ValueError):
+        # ValueError is raised when mapping empty files
+        return None
+
+    try:
+        header = _read_header(mm)
+
+        if not header:
+            return None
+
+        revision, length, checksum = header
+        payload = mm[_HEADER.size:_HEADER.size + length]
+
+    finally:
+        mm.close()
+
+    if zlib.crc32(payload) & 0xffffffff != checksum:
+        return None
+
+    try:
+        values = json.loads(payload.decode('utf-8'))
+
+    except ValueError:
+        return None
+
+    return revision, values
+
+def read_revision(path):
+    """Read the revision of a snapshot file without reading its payload.
+
+    Arguments:
+        path (str): Path to the snapshot file.
+
+    Returns:
+        Revision or ``None`` if the file does not exist or is not a valid
+        snapshot.
+    """
+    try:
+        with open(path, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    except (IOError, OSError, ValueError):
+        return None
+
+    try:
+        header = _read_header(mm)
+
+    finally:
+        mm.close()
+
+    return header[0] if header else None
+
+def write(path, revision, values):
+    """Write a snapshot file.
+
+    The snapshot is written to a temporary file that then replaces the
+    previous one.
+
+    Arguments:
+        path (str): Path to the snapshot file.
+        revision (int): Revision of the configuration.
+        values (dict): Stored (serialized) values of the configuration.
+    """
+    payload = json.dumps(values, separators=(',', ':')).encode('utf-8')
+    header = _HEADER.pack(
+        _MAGIC, revision, len(payload), zlib.crc32(payload) & 0xffffffff)
+
+    # Unique for each thread, as several threads may write at the same time
+    tmp_path = '%s.%d.%d.tmp' % (
+        path, os.getpid(), threading.current_thread().ident)
+
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(header)
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.rename(tmp_path, path)
+
+    except:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+        raise
+
+def _read_header(mm):
+    """Parse the header of a mapped snapshot file.
+
+    Arguments:
+        mm (mmap.mmap): Mapped file.
+
+    Returns:
+        tuple with the revision, payload length and checksum, or ``None`` if
+        the header is not valid.
+    """
+    if len(mm) < _HEADER.size:
+        return None
+
+    magic, revision, length, checksum = _HEADER.unpack_from(mm, 0)
+
+    if magic != _MAGIC or len(mm) < _HEADER.size + length:
+        return None
+
+    return revision, length, checksum
@@ -18,6 +18,68 @@
 # with this program; if not, write to the Free Software Foundation, Inc.,
 # 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 
+from __future__ import absolute_import
+
+from .models import WaffleMixin
+import contextlib
+import sqlite3
+import threading
+import time
+
+# Maximum number of keys sent in a single ``IN (...)`` clause (SQLite does not
+# allow more than 999 variables per statement in older versions)
+_BATCH_SIZE = 500
+
+# Reserved key used for storing the revision of the configuration
+REVISION_KEY = 'WAFFLE_REVISION'
+
+# Clock used for expiration times
+_now = getattr(time, 'monotonic', time.time)
+
+
+def _chunks(items, size=_BATCH_SIZE):
+    """Split a list of items in chunks of the given size.
+
+    Arguments:
+        items (list): Items to split.
+        size (int): Maximum size of each of the chunks.
+
+    Returns:
+        Generator of lists.
+    """
+    items = list(items)
+
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _decode(value):
+    """Decode a value obtained from Redis.
+
+    Arguments:
+        value (bytes): Raw value.
+
+    Returns:
+        Value as string.
+    """
+    if isinstance(value, bytes):
+        return value.decode('utf-8')
+
+    return value
+
+
+class _Record(WaffleMixin):
+    """Plain record used by stores that do not work with model instances.
+
+    Arguments:
+        key (str): Name of the configuration variable.
+        value (str): Stored (serialized) value.
+    """
+
+    def __init__(self, key, value):
+        self.key = key
+        self.value = value
+
 
 class WaffleStore(object):
     """Object for connecting to the application database.
@@ -38,6 +100,33 @@ class WaffleStore(object):
         """Commit to database where needed."""
         raise NotImplementedError
 
+    def rollback(self):
+        """Discard uncommitted changes where needed."""
+        raise NotImplementedError
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """Group several writes in a single transaction.
+
+        Changes are committed once when the block finishes, or rolled back
+        entirely if an exception is raised inside the block::
+
+            with store.transaction():
+                store.put('SITENAME', value1)
+                store.put('MAX_FILESIZE', value2)
+
+        Yields:
+            The store itself.
+        """
+        try:
+            yield self
+
+        except:
+            self.rollback()
+            raise
+
+        self.commit()
+
     def delete(self, key):
         """Remove a configuration variable from the database.
 
@@ -60,6 +149,77 @@ class WaffleStore(object):
         """
         raise NotImplementedError
 
+    def get_many(self, keys):
+        """Obtain several configuration variables from the database.
+
+        Stores should override this method in order to obtain all the
+        records in a single query. By default, :py:meth:`get` is called for
+        each of the keys.
+
+        Arguments:
+            keys (list[str]): Names of the configuration variables to obtain.
+
+        Returns:
+            dict mapping the names of the variables found to their records.
+        """
+        result = {}
+
+        for key in keys:
+            record = self.get(key)
+
+            if record:
+                result[key] = record
+
+        return result
+
+    def invalidate(self, keys=None):
+        """Discard locally cached records.
+
+        Called when other processes notify that the configuration changed.
+        Stores that do not cache records do nothing.
+
+        Arguments:
+            keys (list[str]): Names of the configuration variables to discard.
+                If not provided, all the records are discarded.
+        """
+        pass
+
+    def get_revision(self):
+        """Obtain the revision of the stored configuration.
+
+        The revision is stored as a regular record using the reserved
+        ``WAFFLE_REVISION`` key.
+
+        Returns:
+            Revision number (``0`` if the configuration was never updated).
+        """
+        record = self.get(REVISION_KEY)
+
+        if not record:
+            return 0
+
+        try:
+            return int(record.get_value())
+
+        except (TypeError, ValueError):
+            return 0
+
+    def bump_revision(self):
+        """Increment the revision of the stored configuration.
+
+        Should be called in the same transaction as the updates. Stores
+        should override this method in order to increment the revision
+        atomically, as by default concurrent updates may obtain the same
+        revision.
+
+        Returns:
+            New revision number.
+        """
+        revision = self.get_revision() + 1
+        self.put(REVISION_KEY, str(revision))
+
+        return revision
+
     def put(self, key, value):
         """Insert / Update a configuration variable in the database.
 
@@ -72,13 +232,37 @@ class WaffleStore(object):
         """
         raise NotImplementedError
 
+    def put_many(self, values):
+        """Insert / Update several configuration variables in the database.
+
+        Stores should override this method in order to write all the
+        records with as few statements as possible. By default,
+        :py:meth:`put` is called for each of the keys.
+
+        Arguments:
+            values (dict): Names of the configuration variables mapped to
+                the values to store in the database (serialized).
+
+        Returns:
+            list of updated records.
+        """
+        return [self.put(key, value) for key, value in values.items()]
+
 
 class AlchemyWaffleStore(WaffleStore):
-    """Config store for SQLAlchemy."""
+    """Config store for SQLAlchemy.
+
+    Values are written with a single upsert statement in SQLite (3.24 or
+    newer), PostgreSQL and MySQL when the ``key`` column of the model is
+    unique. Otherwise, the existing records are looked up first.
+    """
 
     def commit(self):
         self.db.session.commit()
 
+    def rollback(self):
+        self.db.session.rollback()
+
     def delete(self, key):
         record = self.model.query.filter_by(key=key).first()
 
@@ -92,41 +276,263 @@ class AlchemyWaffleStore(WaffleStore):
     def get(self, key):
         return self.model.query.filter_by(key=key).first()
 
+    def bump_revision(self):
+        from sqlalchemy import Integer, cast, func
+
+        session = self.db.session
+        table = self.model.__table__
+        where = table.c.key == REVISION_KEY
+        value = cast(table.c.value, Integer)
+
+        # Keep the order of pending changes
+        session.flush()
+
+        # Increment in a single statement, so that concurrent updates obtain
+        # different revisions (the row stays locked until committing)
+        increment = table.update().where(where).values(value=value + 1)
+
+        if not session.execute(increment).rowcount:
+            # First update: create the record, unless another process did
+            dialect, insert = self._insert()
+            stmt = insert(table).values(key=REVISION_KEY, value='0')
+
+            if dialect == 'mysql':
+                stmt = stmt.prefix_with('IGNORE')
+
+            elif dialect:
+                stmt = stmt.on_conflict_do_nothing()
+
+            session.execute(stmt)
+            session.execute(increment)
+
+        revision = session.query(func.max(value)).filter(where).scalar()
+
+        if not self._unique_key():
+            # Concurrent first updates may have created several records:
+            # keep the latest
+            session.execute(
+                table.delete().where(where).where(value < revision))
+
+        self._expire()
+
+        return int(revision)
+
+    def get_many(self, keys):
+        result = {}
+
+        for chunk in _chunks(keys):
+            records = self.model.query.filter(
+                self.model.key.in_(chunk)).all()
+
+            for record in records:
+                result[record.key] = record
+
+        return result
+
     def put(self, key, value):
-        record = self.model.query.filter_by(key=key).first()
+        return self.put_many({key: value})[0]
+
+    def put_many(self, values):
+        if not values:
+            return []
+
+        if self._upsert(values):
+            return [_Record(key, value) for key, value in values.items()]
+
+        existing = self.get_many(values.keys())
+        new_records = []
+
+        for key, value in values.items():
+            record = existing.get(key)
+
+            if not record:
+                # Creating new record
+                record = self.model()
+                record.key = key
+                new_records.append(record)
 
-        if not record:
-            # Creating new record
-            record = self.model()
-            record.key = key
             record.value = value
 
-            self.db.session.add(record)
+        # Insert all the new records at once
+        self.db.session.add_all(new_records)
+
+        return list(existing.values()) + new_records
+
+    def _upsert(self, values):
+        """Insert or update records using the upsert statement of the dialect.
+
+        Arguments:
+            values (dict): Names of the configuration variables and their
+                stored (serialized) values.
+
+        Returns:
+            ``True`` if the records were written, ``False`` if the dialect
+            does not support upserts.
+        """
+        session = self.db.session
+        dialect, insert = self._insert()
+
+        if not dialect or not self._unique_key():
+            return False
+
+        table = self.model.__table__
+
+        # Keep the order of pending changes (e.g. deletions)
+        session.flush()
+
+        for chunk in _chunks(values.items()):
+            stmt = insert(table).values(
+                [{'key': key, 'value': value} for key, value in chunk])
+
+            if dialect == 'mysql':
+                stmt = stmt.on_duplicate_key_update(value=stmt.inserted.value)
+
+            else:
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[table.c.key],
+                    set_={'value': stmt.excluded.value})
+
+            session.execute(stmt)
+
+        self._expire()
+
+        return True
+
+    def _insert(self):
+        """Obtain the insert construct of the dialect, if it supports upserts.
+
+        Returns:
+            tuple with the name of the dialect and its ``insert`` function, or
+            ``None`` and the generic ``insert`` function if the dialect does
+            not support upserts.
+        """
+        dialect = self.db.session.get_bind(mapper=self.model).dialect.name
+
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+
+        elif dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+
+        elif dialect == 'mysql':
+            from sqlalchemy.dialects.mysql import insert
 
         else:
-            # Updating record
-            record.value = value
+            from sqlalchemy import insert
+            dialect = None
 
-        return record
+        return dialect, insert
+
+    def _unique_key(self):
+        """Check whether the ``key`` column of the model is unique.
+
+        Upserts require a unique constraint (or index) on the column.
+
+        Returns:
+            ``True`` if the column is unique, ``False`` otherwise.
+        """
+        from sqlalchemy import PrimaryKeyConstraint, UniqueConstraint
+
+        table = self.model.__table__
+        column = table.c.key
+
+        if column.unique or column.primary_key:
+            return True
+
+        unique = [c for c in table.constraints
+                  if isinstance(c, (PrimaryKeyConstraint, UniqueConstraint))]
+        unique.extend(i for i in table.indexes if i.unique)
+
+        for constraint in unique:
+            if [c.name for c in constraint.columns] == [column.name]:
+                return True
+
+        return False
+
+    def _expire(self):
+        """Expire the records loaded in the session.
+
+        Called after writing with statements that bypass the session, as
+        those records may be outdated.
+        """
+        session = self.db.session
+
+        for record in list(session.identity_map.values()):
+            if isinstance(record, self.model):
+                session.expire(record)
 
 
 class PeeweeWaffleStore(WaffleStore):
-    """Config store for peewee."""
+    """Config store for peewee.
+
+    Values are written with a single upsert statement in SQLite (3.24 or
+    newer), PostgreSQL and MySQL when the ``key`` field of the model is
+    unique. Otherwise, the existing records are looked up first.
+    """
 
     def commit(self):
-        if self.db.get_autocommit():
+        # peewee 3 removed autocommit mode: statements executed outside of a
+        # transaction are committed automatically
+        if getattr(self.db, 'get_autocommit', None) and \
+                self.db.get_autocommit():
             self.db.commit()
 
+    def rollback(self):
+        self.db.rollback()
+
+    @contextlib.contextmanager
+    def transaction(self):
+        with self.db.atomic():
+            yield self
+
     def delete(self, key):
-        record = self.get(self.model, key)
+        query = self.model.delete().where(self.model.key == key)
 
-        try:
-            record.delete_instance()
-            return record
+        if getattr(self.db, 'returning_clause', False):
+            records = list(
+                query.returning(self.model.key, self.model.value).execute())
 
-        except:
+            return records[0] if records else None
+
+        if not query.execute():
             return None
 
+        # Deleted value is unknown without RETURNING
+        return _Record(key, None)
+
+    def bump_revision(self):
+        import peewee
+
+        where = self.model.key == REVISION_KEY
+
+        # MySQL does not cast to INTEGER
+        value = self.model.value.cast(
+            'SIGNED' if isinstance(self.db, peewee.MySQLDatabase)
+            else 'INTEGER')
+
+        def increment():
+            # Increment in a single statement, so that concurrent updates
+            # obtain different revisions (the row stays locked until
+            # committing)
+            return self.model.update(
+                value=peewee.Expression(value, '+', 1)).where(where).execute()
+
+        if not increment():
+            # First update: create the record, unless another process did
+            self.model.insert(
+                key=REVISION_KEY, value='0').on_conflict_ignore().execute()
+            increment()
+
+        revision = self.model.select(
+            peewee.fn.MAX(value)).where(where).scalar()
+
+        if not self._unique_key():
+            # Concurrent first updates may have created several records:
+            # keep the latest
+            self.model.delete().where(where, value < revision).execute()
+
+        return int(revision)
+
     def get(self, key):
         try:
             return self.model.get(self.model.key == key)
@@ -135,16 +541,519 @@ class PeeweeWaffleStore(WaffleStore):
             # Does not exist
             return None
 
+    def get_many(self, keys):
+        result = {}
+
+        for chunk in _chunks(keys):
+            query = self.model.select().where(self.model.key.in_(chunk))
+
+            for record in query:
+                result[record.key] = record
+
+        return result
+
     def put(self, key, value):
+        return self.put_many({key: value})[0]
+
+    def put_many(self, values):
+        if not values:
+            return []
+
+        if self._upsert(values):
+            return [_Record(key, value) for key, value in values.items()]
+
+        existing = self.get_many(values.keys())
+        records = []
+        rows = []
+
+        for key, value in values.items():
+            record = existing.get(key)
+
+            if record:
+                # Updating record
+                record.value = value
+                record.save()
+
+            else:
+                # Creating new record (inserted in bulk later)
+                record = self.model(key=key, value=value)
+                rows.append({'key': key, 'value': value})
+
+            records.append(record)
+
+        for chunk in _chunks(rows):
+            self.model.insert_many(chunk).execute()
+
+        return records
+
+    def _upsert(self, values):
+        """Insert or update records using the upsert statement of the database.
+
+        Arguments:
+            values (dict): Names of the configuration variables and their
+                stored (serialized) values.
+
+        Returns:
+            ``True`` if the records were written, ``False`` if the database
+            does not support upserts.
+        """
+        import peewee
+
+        if not self._unique_key():
+            return False
+
+        if isinstance(self.db, peewee.MySQLDatabase):
+            # ON DUPLICATE KEY UPDATE has no conflict target
+            conflict = {'preserve': [self.model.value]}
+
+        elif isinstance(
+                self.db, (peewee.SqliteDatabase, peewee.PostgresqlDatabase)):
+            conflict = {
+                'conflict_target': [self.model.key],
+                'preserve': [self.model.value]
+            }
+
+        else:
+            return False
+
+        for chunk in _chunks(values.items()):
+            rows = [{'key': key, 'value': value} for key, value in chunk]
+            self.model.insert_many(rows).on_conflict(**conflict).execute()
+
+        return True
+
+    def _unique_key(self):
+        """Check whether the ``key`` field of the model is unique.
+
+        Upserts require a unique constraint (or index) on the field.
+
+        Returns:
+            ``True`` if the field is unique, ``False`` otherwise.
+        """
+        field = self.model.key
+
+        if field.unique or field.primary_key:
+            return True
+
+        for index in self.model._meta.indexes:
+            if isinstance(index, (list, tuple)):
+                fields, unique = index
+
+                if unique and tuple(fields) == (field.name,):
+                    return True
+
+        return False
+
+
+class RedisWaffleStore(WaffleStore):
+    """Config store for Redis.
+
+    All the configuration variables are stored in a single hash. Writes are
+    queued in a pipeline (one for each thread) and sent in a single
+    ``MULTI``/``EXEC`` transaction when committing, or along with the
+    increment of the revision when calling :py:meth:`bump_revision` (which
+    should be the last operation of the transaction).
+
+    Arguments:
+        db: ``redis.StrictRedis`` instance.
+        model: Not used.
+        key (str): Name of the hash.
+    """
+
+    def __init__(self, db=None, model=None, key='waffleconf'):
+        super(RedisWaffleStore, self).__init__(db, model)
+
+        self.key = key
+        self._local = threading.local()
+
+    def _pipeline(self):
+        """Obtain the pipeline of the current thread.
+
+        Returns:
+            ``redis.client.Pipeline`` instance.
+        """
+        pipe = getattr(self._local, 'pipe', None)
+
+        if pipe is None:
+            pipe = self.db.pipeline(transaction=True)
+            self._local.pipe = pipe
+
+        return pipe
+
+    def commit(self):
+        pipe = getattr(self._local, 'pipe', None)
+
+        if pipe is None:
+            return
+
+        self._local.pipe = None
+        pipe.execute()
+
+    def rollback(self):
+        pipe = getattr(self._local, 'pipe', None)
+
+        if pipe is None:
+            return
+
+        self._local.pipe = None
+        pipe.reset()
+
+    def delete(self, key):
         record = self.get(key)
 
         if not record:
-            # Creating new record
-            record = self.model()
-            record.key = key
+            return None
+
+        self._pipeline().hdel(self.key, key)
+
+        return record
+
+    def get(self, key):
+        value = self.db.hget(self.key, key)
+
+        if value is None:
+            return None
+
+        return _Record(key, _decode(value))
 
-        record.value = value
+    def get_many(self, keys):
+        keys = list(keys)
 
-        record.save()
+        if not keys:
+            return {}
+
+        if len(keys) > _BATCH_SIZE:
+            # Cheaper to obtain the whole hash
+            values = dict(
+                (_decode(k), v) for k, v in self.db.hgetall(self.key).items())
+            values = [values.get(key) for key in keys]
+
+        else:
+            values = self.db.hmget(self.key, keys)
+
+        result = {}
+
+        for key, value in zip(keys, values):
+            if value is not None:
+                result[key] = _Record(key, _decode(value))
+
+        return result
+
+    def bump_revision(self):
+        # The new revision must be known right away: send the pending writes
+        # along with the increment, so that other processes never see the
+        # new revision without the values
+        pipe = self._pipeline()
+        pipe.hincrby(self.key, REVISION_KEY, 1)
+
+        self._local.pipe = None
+
+        return pipe.execute()[-1]
+
+    def put(self, key, value):
+        self._pipeline().hset(self.key, key, value)
+
+        return _Record(key, value)
+
+    def put_many(self, values):
+        if values:
+            self._pipeline().hset(self.key, mapping=values)
+
+        return [_Record(key, value) for key, value in values.items()]
+
+
+class SQLiteWaffleStore(WaffleStore):
+    """Config store for SQLite using the ``sqlite3`` module directly.
+
+    The table is created when first connecting and the database is used in
+    WAL mode, so that readers do not block writers (nor the other way
+    around). Each thread uses its own connection, and writes are done in a
+    transaction that takes the write lock right away (``BEGIN IMMEDIATE``)
+    and lasts until :py:meth:`commit` or :py:meth:`rollback` are called.
+
+    In-memory databases cannot be used, as they are not shared between
+    connections.
+
+    Arguments:
+        db (str): Path to the database file.
+        model: Not used.
+        table (str): Name of the table.
+        timeout (float): Number of seconds to wait for the write lock.
+    """
+
+    def __init__(self, db=None, model=None, table='waffleconf', timeout=5):
+        super(SQLiteWaffleStore, self).__init__(db, model)
+
+        self.table = table
+        self.timeout = timeout
+        self._local = threading.local()
+
+        # Statements are compiled once for each connection (sqlite3 caches
+        # them by their text)
+        name = '"%s"' % table.replace('"', '""')
+        self._sql = {
+            'create': 'CREATE TABLE IF NOT EXISTS %s '
+                      '(key TEXT PRIMARY KEY NOT NULL, value TEXT)' % name,
+            'delete': 'DELETE FROM %s WHERE key = ?' % name,
+            'get': 'SELECT value FROM %s WHERE key = ?' % name,
+            'get_all': 'SELECT key, value FROM %s' % name,
+            'get_many': 'SELECT key, value FROM %s WHERE key IN (%%s)' % name,
+            'put': 'INSERT OR REPLACE INTO %s (key, value) '
+                   'VALUES (?, ?)' % name,
+            'bump': 'UPDATE %s SET value = CAST(value AS INTEGER) + 1 '
+                    'WHERE key = ?' % name,
+        }
+
+    def _connection(self):
+        """Obtain the connection of the current thread.
+
+        Returns:
+            ``sqlite3.Connection`` instance.
+        """
+        conn = getattr(self._local, 'conn', None)
+
+        if conn is None:
+            # Transactions are started explicitly (see _begin())
+            conn = sqlite3.connect(
+                self.db, timeout=self.timeout, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(self._sql['create'])
+
+            self._local.conn = conn
+            self._local.writing = False
+
+        return conn
+
+    def _begin(self):
+        """Start a write transaction in the current thread if needed.
+
+        Returns:
+            ``sqlite3.Connection`` instance.
+        """
+        conn = self._connection()
+
+        if not self._local.writing:
+            conn.execute('BEGIN IMMEDIATE')
+            self._local.writing = True
+
+        return conn
+
+    def commit(self):
+        if not getattr(self._local, 'writing', False):
+            return
+
+        self._local.writing = False
+        self._local.conn.execute('COMMIT')
+
+    def rollback(self):
+        if not getattr(self._local, 'writing', False):
+            return
+
+        self._local.writing = False
+        self._local.conn.execute('ROLLBACK')
+
+    def delete(self, key):
+        # Do not start a transaction (and hold the write lock) for nothing
+        record = self.get(key)
+
+        if not record:
+            return None
+
+        if not self._begin().execute(self._sql['delete'], (key,)).rowcount:
+            # Deleted by someone else in the meantime
+            return None
+
+        return record
+
+    def get(self, key):
+        row = self._connection().execute(self._sql['get'], (key,)).fetchone()
+
+        if row is None:
+            return None
+
+        return _Record(key, row[0])
+
+    def get_many(self, keys):
+        keys = list(keys)
+
+        if not keys:
+            return {}
+
+        conn = self._connection()
+
+        if len(keys) > _BATCH_SIZE:
+            # Cheaper to obtain the whole table in a single query
+            wanted = set(keys)
+            rows = [
+                row for row in conn.execute(self._sql['get_all'])
+                if row[0] in wanted]
+
+        else:
+            rows = conn.execute(
+                self._sql['get_many'] % ', '.join('?' * len(keys)), keys)
+
+        return dict((key, _Record(key, value)) for key, value in rows)
+
+    def bump_revision(self):
+        conn = self._begin()
+
+        if not conn.execute(self._sql['bump'], (REVISION_KEY,)).rowcount:
+            conn.execute(self._sql['put'], (REVISION_KEY, '1'))
+
+        row = conn.execute(self._sql['get'], (REVISION_KEY,)).fetchone()
+
+        return int(row[0])
+
+    def put(self, key, value):
+        return self.put_many({key: value})[0]
+
+    def put_many(self, values):
+        if values:
+            self._begin().executemany(self._sql['put'], values.items())
+
+        return [_Record(key, value) for key, value in values.items()]
+
+
+class CachedWaffleStore(WaffleStore):
+    """Read-through cache for any other config store.
+
+    Records obtained from the wrapped store are kept in memory for ``ttl``
+    seconds (counted separately for each key) and writes go through to the
+    wrapped store while updating the cache. Cached records are discarded
+    when other processes notify an update.
+
+    The revision of the configuration is never cached.
+
+    Arguments:
+        store (WaffleStore): Store to wrap.
+        ttl (float): Number of seconds a record is kept in memory.
+    """
+
+    def __init__(self, store, ttl=60):
+        super(CachedWaffleStore, self).__init__(store.db, store.model)
+
+        self.store = store
+        self.ttl = ttl
+
+        # key -> (expiration time, record)
+        self._records = {}
+        self._lock = threading.Lock()
+
+    def _cache(self, key, value):
+        """Store a record in the cache.
+
+        Arguments:
+            key (str): Name of the configuration variable.
+            value (str): Stored (serialized) value.
+        """
+        with self._lock:
+            self._records[key] = (_now() + self.ttl, _Record(key, value))
+
+    def _cached(self, key):
+        """Obtain a record from the cache.
+
+        Arguments:
+            key (str): Name of the configuration variable.
+
+        Returns:
+            Record or ``None`` if not cached or expired.
+        """
+        with self._lock:
+            expires, record = self._records.get(key, (0, None))
+
+            if record and expires <= _now():
+                del self._records[key]
+                return None
+
+        return record
+
+    def commit(self):
+        self.store.commit()
+
+    def rollback(self):
+        self.store.rollback()
+
+        # Cache may contain values that were not committed
+        self.invalidate()
+
+    @contextlib.contextmanager
+    def transaction(self):
+        try:
+            with self.store.transaction():
+                yield self
+
+        except:
+            self.invalidate()
+            raise
+
+    def delete(self, key):
+        self.invalidate([key])
+
+        return self.store.delete(key)
+
+    def get(self, key):
+        record = self._cached(key)
+
+        if record:
+            return record
+
+        record = self.store.get(key)
+
+        if record:
+            self._cache(key, record.get_value())
+
+        return record
+
+    def get_many(self, keys):
+        result = {}
+        missing = []
+
+        for key in keys:
+            record = self._cached(key)
+
+            if record:
+                result[key] = record
+
+            else:
+                missing.append(key)
+
+        if missing:
+            records = self.store.get_many(missing)
+
+            for key, record in records.items():
+                self._cache(key, record.get_value())
+
+            result.update(records)
+
+        return result
+
+    def get_revision(self):
+        return self.store.get_revision()
+
+    def bump_revision(self):
+        return self.store.bump_revision()
+
+    def invalidate(self, keys=None):
+        with self._lock:
+            if keys is None:
+                self._records.clear()
+
+            else:
+                for key in keys:
+                    self._records.pop(key, None)
+
+        self.store.invalidate(keys)
+
+    def put(self, key, value):
+        record = self.store.put(key, value)
+        self._cache(key, value)
 
         return record
+
+    def put_many(self, values):
+        records = self.store.put_many(values)
+
+        for key, value in values.items():
+            self._cache(key, value)
+
+        return records
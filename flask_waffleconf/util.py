@@ -19,26 +19,289 @@
 # 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 
 import base64
+import hashlib
+import json
 import pickle
+import threading
+import zlib
+from collections import OrderedDict
+
+try:
+    import msgpack
+    _HAS_MSGPACK = True
+
+except ImportError:
+    _HAS_MSGPACK = False
+
+try:
+    import lzma
+    _HAS_LZMA = True
+
+except ImportError:
+    _HAS_LZMA = False
+
+
+class Serializer(object):
+    """Serialization format for stored values.
+
+    Values are stored as ``<tag>:<payload>`` strings so that rows written
+    with different formats can coexist in the database. Binary payloads are
+    encoded in base64.
+
+    Arguments:
+        name (str): Name used in the ``WAFFLE_SERIALIZER`` setting.
+        tag (str): Short identifier prepended to serialized values.
+        dumps: Function that converts an object to bytes.
+        loads: Function that converts bytes back to an object.
+        binary (bool): Whether the payload must be encoded in base64 or can
+            be stored as UTF-8 text.
+    """
+
+    def __init__(self, name, tag, dumps, loads, binary=True):
+        self.name = name
+        self.tag = tag
+        self.dumps = dumps
+        self.loads = loads
+        self.binary = binary
+
+
+# Registered serializers by name and by tag
+_SERIALIZERS = {}
+_TAGS = {}
+
+# Compression formats by name: suffix appended to the serializer tag and
+# functions that compress and decompress bytes
+_COMPRESSIONS = {
+    'zlib': ('z', zlib.compress, zlib.decompress),
+}
+
+if _HAS_LZMA:
+    _COMPRESSIONS['lzma'] = ('x', lzma.compress, lzma.decompress)
+
+_SUFFIXES = dict(
+    (suffix, decompress) for suffix, _, decompress in _COMPRESSIONS.values())
+
+def register_serializer(serializer):
+    """Register a serialization format.
+
+    Arguments:
+        serializer (Serializer): Format to register. Its name and tag must
+            not contain the ``:`` character.
+    """
+    _SERIALIZERS[serializer.name] = serializer
+    _TAGS[serializer.tag] = serializer
+
+def get_serializer(name):
+    """Obtain a registered serialization format.
+
+    Arguments:
+        name (str): Name of the serializer. If it is not registered (e.g.
+            msgpack is not installed), it will default to pickle.
+
+    Returns:
+        Serializer object.
+    """
+    return _SERIALIZERS.get(name, _SERIALIZERS['pickle'])
 
 def deserialize(data):
-    """Deserialize data using base64 encoding and pickle.
+    """Deserialize data obtained from the database.
+
+    Values without a format tag are considered to be pickled and encoded in
+    base64 (legacy format). Compressed values have the suffix of the
+    compression format appended to the tag (e.g. ``pz:`` for pickle and
+    zlib).
 
     Arguments:
-        data (str): Data to deserialize (must be in base64 and pickled)
+        data (str): Data to deserialize.
 
     Returns:
-        Unpickled object.
+        Deserialized object.
     """
-    return pickle.loads(base64.b64decode(data.encode()))
+    tag, sep, payload = data.partition(':')
+
+    if not sep:
+        # Legacy format (base64 never contains ':')
+        return pickle.loads(base64.b64decode(data.encode()))
+
+    serializer = _TAGS.get(tag)
+
+    if serializer is None:
+        # Compressed payload
+        serializer = _TAGS[tag[:-1]]
+        decompress = _SUFFIXES[tag[-1:]]
+
+        return serializer.loads(decompress(base64.b64decode(payload.encode())))
 
-def serialize(data):
-    """Serialize data using pickle and converting it to a base64 string.
+    if serializer.binary:
+        return serializer.loads(base64.b64decode(payload.encode()))
+
+    return serializer.loads(payload.encode('utf-8'))
+
+class LazyValue(object):
+    """Stored value that is only deserialized when first needed.
+
+    Used for large values when the ``WAFFLE_LAZY_VALUES`` setting is set. The
+    deserialized object is kept after the first call to :py:meth:`get`.
 
     Arguments:
-        data: data to serialize (must be picklable)
+        data (str): Stored (serialized) value.
+        loads: Function used to deserialize the value. Defaults to
+            :py:func:`deserialize`.
+    """
+
+    __slots__ = ('data', '_loads', '_value')
+
+    def __init__(self, data, loads=None):
+        self.data = data
+        self._loads = loads or deserialize
+        self._value = None
+
+    def __eq__(self, other):
+        if isinstance(other, LazyValue):
+            return self.data == other.data
+
+        return self.get() == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return '<LazyValue (%d characters)>' % len(self.data)
+
+    def get(self):
+        """Obtain the deserialized value.
+
+        Returns:
+            Deserialized object.
+        """
+        if self._loads is not None:
+            self._value = self._loads(self.data)
+            self._loads = None
+
+        return self._value
+
+class DeserializeCache(object):
+    """Bounded cache of deserialized values.
+
+    Values are indexed by a hash of their stored (serialized) string, so
+    that unchanged values are not deserialized again when reloading the
+    configuration. The least recently used values are evicted first.
+
+    Note that the same object is returned for the same stored string, so
+    cached values should not be modified in place.
+
+    Arguments:
+        maxsize (int): Maximum number of values to keep.
+
+    Attributes:
+        hits (int): Number of values obtained from the cache.
+        misses (int): Number of values that had to be deserialized.
+    """
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+
+        self._values = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._values)
+
+    def clear(self):
+        """Remove all the cached values."""
+        with self._lock:
+            self._values.clear()
+
+    def deserialize(self, data):
+        """Deserialize data, reusing the cached value if possible.
+
+        Arguments:
+            data (str): Data to deserialize.
+
+        Returns:
+            Deserialized object.
+        """
+        digest = hashlib.sha1(data.encode('utf-8')).digest()
+
+        with self._lock:
+            if digest in self._values:
+                # Mark as most recently used
+                value = self._values.pop(digest)
+                self._values[digest] = value
+                self.hits += 1
+
+                return value
+
+            self.misses += 1
+
+        value = deserialize(data)
+
+        with self._lock:
+            self._values[digest] = value
+
+            while len(self._values) > self.maxsize:
+                self._values.popitem(last=False)
+
+        return value
+
+def serialize(data, name='pickle', compress=0, compression='zlib'):
+    """Serialize data in order to store it in the database.
+
+    Pickled values are stored in the legacy format (base64 string without a
+    format tag) so that they can be read by older versions.
+
+    Payloads of at least ``compress`` bytes are compressed (and encoded in
+    base64) unless that does not make the stored value shorter.
+
+    Arguments:
+        data: data to serialize (must be supported by the serializer)
+        name (str): Name of the serializer to use.
+        compress (int): Minimum size of the payload to compress. Payloads are
+            not compressed if ``0``.
+        compression (str): Either 'zlib' or 'lzma'. If lzma is not
+            available, it will default to zlib.
 
     Returns:
         Serialized object.
     """
-    return base64.b64encode(pickle.dumps(data)).decode('utf-8')
+    serializer = get_serializer(name)
+    payload = serializer.dumps(data)
+
+    if compress and len(payload) >= compress:
+        suffix, compress_func, _ = _COMPRESSIONS.get(
+            compression, _COMPRESSIONS['zlib'])
+        compressed = base64.b64encode(compress_func(payload))
+
+        # Size of the uncompressed value without the tag
+        size = len(payload) * 4 // 3 if serializer.binary else len(payload)
+
+        if len(compressed) < size:
+            return '%s%s:%s' % (
+                serializer.tag, suffix, compressed.decode('utf-8'))
+
+    if serializer.name == 'pickle':
+        return base64.b64encode(payload).decode('utf-8')
+
+    if serializer.binary:
+        payload = base64.b64encode(payload)
+
+    return '%s:%s' % (serializer.tag, payload.decode('utf-8'))
+
+
+register_serializer(Serializer('pickle', 'p', pickle.dumps, pickle.loads))
+
+register_serializer(Serializer(
+    'json', 'j',
+    lambda data: json.dumps(data, separators=(',', ':')).encode('utf-8'),
+    lambda data: json.loads(data.decode('utf-8')),
+    binary=False))
+
+if _HAS_MSGPACK:
+    register_serializer(Serializer(
+        'msgpack', 'm',
+        lambda data: msgpack.packb(data, use_bin_type=True),
+        lambda data: msgpack.unpackb(data, raw=False)))
@@ -18,7 +18,12 @@
 # with this program; if not, write to the Free Software Foundation, Inc.,
 # 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 
+import json
 import os
+import random
+import select
+import struct
+import threading
 import time
 
 try:
@@ -28,22 +33,76 @@ try:
 except ImportError:
     _HAS_REDIS = False
 
+try:
+    import ctypes
+    import ctypes.util
+
+    _libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    _libc.inotify_init1
+    _HAS_INOTIFY = True
+
+except (ImportError, OSError, AttributeError):
+    _HAS_INOTIFY = False
+
+# inotify constants (see inotify(7))
+_IN_MODIFY = 0x00000002
+_IN_ATTRIB = 0x00000004
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVE_SELF = 0x00000800
+_IN_DELETE_SELF = 0x00000400
+_IN_IGNORED = 0x00008000
+_IN_CLOEXEC = 0o2000000
+_IN_NONBLOCK = 0o4000
+
+_IN_MASK = (_IN_MODIFY | _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVE_SELF |
+            _IN_DELETE_SELF)
+
+# struct inotify_event without the trailing name
+_IN_EVENT = struct.Struct('iIII')
+
+# Seconds to wait before subscribing again after losing the connection
+_REDIS_RETRY_DELAY = 1
 
-def get_watcher(watcher_type):
+# Guards creation of redis connection pools
+_pool_lock = threading.Lock()
+
+# Clock used for reload intervals
+_now = getattr(time, 'monotonic', time.time)
+
+# Maximum number of seconds the shared watcher threads wait for messages
+# before checking for new subscriptions
+_HUB_POLL = 1
+
+# Process-wide watcher hub (see get_hub())
+_hub = None
+_hub_lock = threading.Lock()
+
+
+def get_watcher(watcher_type, asynchronous=False):
     """Obtain a watcher function.
 
-    These functions should be executed in a separate thread.
+    These functions should be executed in a separate thread, unless
+    ``asynchronous`` is set, in which case a coroutine function is returned
+    (see :py:mod:`flask_waffleconf.aiowatcher`).
 
     Arguments:
-        watcher_type (str): Either 'file' or 'redis'. If redis is not available,
-            it will default to file watcher.
+        watcher_type (str): Either 'file', 'inotify' or 'redis'. If redis or
+            inotify are not available, it will default to file watcher.
+        asynchronous (bool): Whether to obtain the asyncio watcher.
 
     Returns:
         Watcher function.
     """
+    if asynchronous:
+        from . import aiowatcher
+        return aiowatcher.get_watcher(watcher_type)
+
     if watcher_type == 'redis' and _HAS_REDIS:
         return _redis_watcher
 
+    elif watcher_type == 'inotify' and _HAS_INOTIFY:
+        return _inotify_watcher
+
     else:
         return _file_watcher
 
@@ -54,6 +113,87 @@ def _file_watcher(state):
         state (_WaffleState): Object that contains reference to app and its
             configstore.
     """
+    file_path = _prepare_file(state)
+    interval = state.app.config.get('WAFFLE_WATCHER_INTERVAL', 10)
+
+    while True:
+        _check_file(state, file_path)
+
+        # Not too critical
+        time.sleep(interval)
+
+def _inotify_watcher(state):
+    """Wait for inotify events on the watch file and reload config when needed.
+
+    The file is still checked every ``WAFFLE_WATCHER_INTERVAL`` seconds in
+    case an event is missed. Falls back to the file watcher if the inotify
+    instance cannot be created.
+
+    Arguments:
+        state (_WaffleState): Object that contains reference to app and its
+            configstore.
+    """
+    fd = _libc.inotify_init1(_IN_CLOEXEC)
+
+    if fd < 0:
+        return _file_watcher(state)
+
+    file_path = _prepare_file(state)
+    interval = state.app.config.get('WAFFLE_WATCHER_INTERVAL', 10)
+    wd = -1
+
+    try:
+        while True:
+            if not os.path.isfile(file_path):
+                # Create watch file
+                open(file_path, 'a').close()
+
+            if wd < 0:
+                wd = _libc.inotify_add_watch(
+                    fd, file_path.encode('utf-8'), _IN_MASK)
+
+            _check_file(state, file_path)
+
+            readable, _, _ = select.select([fd], [], [], interval)
+
+            if readable and _watch_removed(os.read(fd, 4096)):
+                # File was deleted or replaced, watch it again
+                wd = -1
+
+    finally:
+        os.close(fd)
+
+def _watch_removed(data):
+    """Check whether inotify events report that the watch was removed.
+
+    Arguments:
+        data (bytes): Raw events read from the inotify file descriptor.
+
+    Returns:
+        ``True`` if the watch was removed, ``False`` otherwise.
+    """
+    offset = 0
+
+    while offset + _IN_EVENT.size <= len(data):
+        _, mask, _, length = _IN_EVENT.unpack_from(data, offset)
+
+        if mask & _IN_IGNORED:
+            return True
+
+        offset += _IN_EVENT.size + length
+
+    return False
+
+def _prepare_file(state):
+    """Create the watch file if needed and record its current state.
+
+    Arguments:
+        state (_WaffleState): Object that contains reference to app and its
+            configstore.
+
+    Returns:
+        Path to the watch file.
+    """
     conf = state.app.config
 
     file_path = conf.get('WAFFLE_WATCHER_FILE', '/tmp/waffleconf.txt')
@@ -62,16 +202,80 @@ def _file_watcher(state):
         # Create watch file
         open(file_path, 'a').close()
 
-    while True:
-        tstamp = os.path.getmtime(file_path)
+    state._signature = _file_signature(file_path)
 
-        # Compare timestamps and update config if needed
-        if tstamp > state._tstamp:
-            state.update_conf()
-            state._tstamp = tstamp
+    return file_path
 
-        # Not too critical
-        time.sleep(10)
+def _check_file(state, file_path):
+    """Check the watch file and reload config if needed.
+
+    Arguments:
+        state (_WaffleState): Object that contains reference to app and its
+            configstore.
+        file_path (str): Path to the watch file.
+    """
+    changes = _file_changes(state, file_path)
+
+    if not changes:
+        return
+
+    delay = _reload_delay(state)
+
+    if delay > 0:
+        time.sleep(delay)
+
+        # Include changes notified while waiting
+        changes = _file_changes(state, file_path) or changes
+
+    if not _try_reload(state, *changes):
+        # Check the file again next time
+        state._signature = None
+
+def _file_changes(state, file_path):
+    """Check the watch file for configuration changes.
+
+    The journal file is only read when the watch file or the journal itself
+    changed. Only the keys recorded in the journal need to be reloaded,
+    unless some entries are missing from it.
+
+    Arguments:
+        state (_WaffleState): Object that contains reference to app and its
+            configstore.
+        file_path (str): Path to the watch file.
+
+    Returns:
+        tuple with the revision and keys to reload (see :py:func:`_reload`) or
+        ``None`` if there is nothing to reload.
+    """
+    state._wakeup('file')
+    signature = _file_signature(file_path)
+
+    if signature == state._signature:
+        return None
+
+    state._signature = signature
+
+    revision, keys = _read_journal(_journal_path(file_path), state._revision)
+
+    return _pending(state, revision, keys)
+
+def _file_signature(file_path):
+    """Obtain information used to detect changes in the watch file.
+
+    Arguments:
+        file_path (str): Path to the watch file.
+
+    Returns:
+        tuple with the modification time of the watch file and the size of
+        the journal file.
+    """
+    try:
+        journal_size = os.path.getsize(_journal_path(file_path))
+
+    except OSError:
+        journal_size = -1
+
+    return os.path.getmtime(file_path), journal_size
 
 def _redis_watcher(state):
     """Listen to redis channel for a configuration update notifications.
@@ -80,53 +284,326 @@ def _redis_watcher(state):
         state (_WaffleState): Object that contains reference to app and its
             configstore.
     """
-    conf = state.app.config
+    channel = state.app.config.get('WAFFLE_REDIS_CHANNEL', 'waffleconf')
+
+    sub = _redis_client(state).pubsub(ignore_subscribe_messages=True)
 
-    r = redis.client.StrictRedis(
+    while True:
+        try:
+            sub.subscribe(channel)
+
+            for msg in sub.listen():
+                # Skip non-messages
+                if not msg['type'] == 'message':
+                    continue
+
+                _handle_message(state, msg['data'], sub)
+
+        except redis.exceptions.TimeoutError:
+            # Idle longer than WAFFLE_REDIS_SOCKET_TIMEOUT
+            sub.reset()
+
+        except redis.exceptions.ConnectionError:
+            sub.reset()
+            time.sleep(_REDIS_RETRY_DELAY)
+
+        # Notifications may have been missed while disconnected
+        _try_reload(state, None, None)
+
+def _redis_client(state):
+    """Obtain a redis client that uses the connection pool of the state.
+
+    The pool is created the first time and then shared by the watcher and
+    the notifier.
+
+    Arguments:
+        state (_WaffleState): Object that contains reference to app and its
+            configstore.
+
+    Returns:
+        ``redis.StrictRedis`` instance.
+    """
+    with _pool_lock:
+        if state._redis_pool is None:
+            state._redis_pool = _redis_pool(
+                state.app.config, redis.ConnectionPool)
+
+    return redis.StrictRedis(connection_pool=state._redis_pool)
+
+def _redis_pool(conf, pool_class):
+    """Create a redis connection pool according to the configuration.
+
+    ``WAFFLE_REDIS_URL`` takes precedence over ``WAFFLE_REDIS_UNIX_SOCKET``,
+    which takes precedence over ``WAFFLE_REDIS_HOST`` and
+    ``WAFFLE_REDIS_PORT``.
+
+    Arguments:
+        conf (dict): Application configuration.
+        pool_class: Connection pool class (synchronous or asyncio).
+
+    Returns:
+        Connection pool instance.
+    """
+    options = {
+        'max_connections': conf.get('WAFFLE_REDIS_MAX_CONNECTIONS'),
+        'socket_timeout': conf.get('WAFFLE_REDIS_SOCKET_TIMEOUT'),
+        'socket_connect_timeout': conf.get('WAFFLE_REDIS_CONNECT_TIMEOUT'),
+    }
+
+    url = conf.get('WAFFLE_REDIS_URL')
+    unix_socket = conf.get('WAFFLE_REDIS_UNIX_SOCKET')
+
+    if url:
+        return pool_class.from_url(url, **options)
+
+    elif unix_socket:
+        return pool_class.from_url('unix://' + unix_socket, **options)
+
+    return pool_class(
         host=conf.get('WAFFLE_REDIS_HOST', 'localhost'),
-        port=conf.get('WAFFLE_REDIS_PORT', 6379))
+        port=conf.get('WAFFLE_REDIS_PORT', 6379),
+        **options)
+
+def _handle_message(state, data, sub=None):
+    """Reload config according to a received notification message.
+
+    When a subscription is provided, messages received while waiting to
+    reload (see :py:func:`_reload_delay`) or during the previous reload are
+    handled along with this one.
+
+    Arguments:
+        state (_WaffleState): Object that contains reference to app and its
+            configstore.
+        data: Raw message received.
+        sub: ``redis.client.PubSub`` instance the message was received from.
+    """
+    messages = [data]
+    delay = _reload_delay(state)
+
+    if delay > 0:
+        time.sleep(delay)
+
+    if sub is not None:
+        messages.extend(msg['data'] for msg in _drain(sub))
+
+    changes = _message_changes(state, messages)
 
-    sub = r.pubsub(ignore_subscribe_messages=True)
-    sub.subscribe(conf.get('WAFFLE_REDIS_CHANNEL', 'waffleconf'))
+    if changes:
+        _try_reload(state, *changes)
+
+def _drain(sub):
+    """Obtain the messages already received in a subscription.
+
+    Arguments:
+        sub: ``redis.client.PubSub`` instance.
+
+    Returns:
+        list of messages (dicts with the channel and raw data).
+    """
+    messages = []
 
     while True:
-        for msg in sub.listen():
-            # Skip non-messages
-            if not msg['type'] == 'message':
-                continue
+        msg = sub.get_message(timeout=0)
+
+        if msg is None:
+            return messages
+
+        if msg['type'] == 'message':
+            messages.append(msg)
+
+def _message_changes(state, messages):
+    """Obtain the configuration changes from notification messages.
+
+    Malformed messages, as well as messages received after some other
+    notification was lost, require a full reload.
+
+    Arguments:
+        state (_WaffleState): Object that contains reference to app and its
+            configstore.
+        messages (list): Raw messages received.
+
+    Returns:
+        tuple with the revision and keys to reload (see :py:func:`_reload`) or
+        ``None`` if there is nothing to reload.
+    """
+    state._wakeup('redis')
 
-            tstamp = float(msg['data'])
+    entries = []
 
-            # Compare timestamps and update config if needed
-            if tstamp > state._tstamp:
-                state.update_conf()
-                state._tstamp = tstamp
+    for data in messages:
+        try:
+            entries.append(_parse_message(data))
 
-def get_notifier(notifier_type):
+        except ValueError:
+            # Cannot know what changed
+            entries.append((None, None, None))
+
+    revision, keys, since = _merge_messages(entries)
+
+    if (state._revision is None or revision is None or
+            not since <= state._revision < revision):
+        # Some changes may have been missed
+        keys = None
+
+    return _pending(state, revision, keys)
+
+def _merge_messages(entries):
+    """Merge parsed notification messages into a single one.
+
+    Arguments:
+        entries (list[tuple]): Parsed messages (see :py:func:`_parse_message`).
+
+    Returns:
+        tuple with the latest revision, the keys that changed (``None`` if
+        unknown or some revisions are missing) and the earliest revision they
+        changed from.
+    """
+    if any(revision is None for revision, _, _ in entries):
+        return None, None, None
+
+    revision = max(entry[0] for entry in entries)
+    since = min(entry[2] for entry in entries)
+
+    covered = set()
+    keys = set()
+
+    for last, changed, first in entries:
+        covered.update(range(first + 1, last + 1))
+
+        if changed is None:
+            keys = None
+
+        elif keys is not None:
+            keys.update(changed)
+
+    if keys is None or covered != set(range(since + 1, revision + 1)):
+        return revision, None, since
+
+    return revision, sorted(keys), since
+
+def _reload_delay(state):
+    """Obtain the number of seconds to wait before reloading.
+
+    A random delay of up to ``WAFFLE_RELOAD_JITTER`` seconds spreads the
+    reloads of all the processes notified at the same time, while
+    ``WAFFLE_RELOAD_INTERVAL`` sets the minimum number of seconds between
+    reloads.
+
+    Arguments:
+        state (_WaffleState): Object that contains reference to app and its
+            configstore.
+
+    Returns:
+        Number of seconds to wait.
+    """
+    conf = state.app.config
+
+    delay = random.uniform(0, conf.get('WAFFLE_RELOAD_JITTER', 0))
+    interval = conf.get('WAFFLE_RELOAD_INTERVAL', 0)
+
+    if interval and state._last_reload is not None:
+        delay = max(delay, state._last_reload + interval - _now())
+
+    return delay
+
+def _pending(state, revision, keys):
+    """Check whether changes still have to be loaded.
+
+    Arguments:
+        state (_WaffleState): Object that contains reference to app and its
+            configstore.
+        revision (int): Revision the update leads to or ``None`` if unknown.
+        keys (list[str]): Keys that changed since the loaded revision or
+            ``None`` if all the keys should be reloaded.
+
+    Returns:
+        tuple with the revision and keys or ``None`` if the revision is
+        already loaded.
+    """
+    if revision is not None and revision == state._revision:
+        return None
+
+    return revision, keys
+
+def _reload(state, revision, keys):
+    """Reload config.
+
+    Arguments:
+        state (_WaffleState): Object that contains reference to app and its
+            configstore.
+        revision (int): Revision the update leads to or ``None`` if unknown.
+        keys (list[str]): Keys that changed since the loaded revision or
+            ``None`` if all the keys should be reloaded.
+    """
+    # Stores may require an application context (e.g. Flask-SQLAlchemy)
+    with state.app.app_context():
+        state.update_conf(keys, revision)
+
+    state._last_reload = _now()
+
+def _try_reload(state, revision, keys):
+    """Reload config, logging errors so that the watcher keeps running.
+
+    The loaded revision does not change when the reload fails, so the
+    changes are loaded again by the next check of the watch file or by the
+    next notification.
+
+    Arguments:
+        state (_WaffleState): Object that contains reference to app and its
+            configstore.
+        revision (int): Revision the update leads to or ``None`` if unknown.
+        keys (list[str]): Keys that changed since the loaded revision or
+            ``None`` if all the keys should be reloaded.
+
+    Returns:
+        ``True`` if the config was reloaded, ``False`` otherwise.
+    """
+    try:
+        _reload(state, revision, keys)
+
+    except Exception:
+        state.app.logger.exception('Could not reload configuration')
+        return False
+
+    return True
+
+def get_notifier(notifier_type, asynchronous=False):
     """Obtain a notifier function.
 
     Arguments:
-        notifier_type (str): Either 'file' or 'redis'. If redis is not available,
-            it will default to file watcher.
+        notifier_type (str): Either 'file', 'inotify' or 'redis'. If redis is
+            not available, it will default to file notifier.
+        asynchronous (bool): Whether to obtain the asyncio notifier (see
+            :py:mod:`flask_waffleconf.aiowatcher`).
 
     Returns:
         Notifier function.
     """
+    if asynchronous:
+        from . import aiowatcher
+        return aiowatcher.get_notifier(notifier_type)
+
     if notifier_type == 'redis' and _HAS_REDIS:
         return _redis_notifier
 
     else:
         return _file_notifier
 
-def _file_notifier(state):
+def _file_notifier(state, keys=None, revision=None, since=None):
     """Notify of configuration update through file.
 
+    The changed keys are appended to a journal file next to the watch file
+    before updating the timestamp of the latter.
+
     Arguments:
         state (_WaffleState): Object that contains reference to app and its
             configstore.
+        keys (list[str]): Keys that changed. If not provided, other processes
+            will reload all the keys.
+        revision (int): Revision of the stored configuration after the update.
+        since (int): Revision the keys changed from. Defaults to the previous
+            revision.
     """
-    tstamp = time.time()
-    state._tstamp = tstamp
     conf = state.app.config
 
     file_path = conf.get('WAFFLE_WATCHER_FILE', '/tmp/waffleconf.txt')
@@ -135,24 +612,624 @@ def _file_notifier(state):
         # Create watch file
         open(file_path, 'a').close()
 
+    # Record changed keys
+    _write_journal(
+        _journal_path(file_path), _build_message(revision, keys, since))
+
     # Update timestamp
-    os.utime(file_path, (tstamp, tstamp))
+    os.utime(file_path, None)
 
-def _redis_notifier(state):
+def _redis_notifier(state, keys=None, revision=None, since=None):
     """Notify of configuration update through redis.
 
     Arguments:
         state (_WaffleState): Object that contains reference to app and its
             configstore.
+        keys (list[str]): Keys that changed. If not provided, other processes
+            will reload all the keys.
+        revision (int): Revision of the stored configuration after the update.
+        since (int): Revision the keys changed from. Defaults to the previous
+            revision.
     """
-    tstamp = time.time()
-    state._tstamp = tstamp
     conf = state.app.config
 
-    # Notify timestamp
-    r = redis.client.StrictRedis()
-    r.publish(conf.get('WAFFLE_REDIS_CHANNEL', 'waffleconf'), tstamp)
+    # Notify revision and changed keys
+    r = _redis_client(state)
+    r.publish(
+        conf.get('WAFFLE_REDIS_CHANNEL', 'waffleconf'),
+        _build_message(revision, keys, since))
+
+def _build_message(revision, keys=None, since=None):
+    """Build a notification message.
+
+    Arguments:
+        revision (int): Revision of the stored configuration after the update.
+        keys (list[str]): Keys that changed or ``None`` if all the keys
+            should be reloaded.
+        since (int): Revision the keys changed from, when the message covers
+            several updates.
+
+    Returns:
+        JSON string.
+    """
+    message = {'revision': revision, 'keys': keys}
+
+    if keys is not None:
+        message['keys'] = sorted(keys)
+
+    if since is not None and revision is not None and since != revision - 1:
+        message['since'] = since
+
+    return json.dumps(message)
+
+def _parse_message(data):
+    """Parse a notification message.
+
+    Plain timestamps sent by older versions of the extension are accepted as
+    an update of unknown keys. Note that older versions do not update the
+    stored revision, so such updates are skipped if it matches the one
+    already loaded.
+
+    Arguments:
+        data (str): Message to parse.
+
+    Returns:
+        tuple with the revision the update leads to, the list of keys that
+        changed (``None`` if unknown) and the revision they changed from
+        (``None`` if unknown).
+
+    Raises:
+        ValueError: if the message is malformed.
+    """
+    if isinstance(data, bytes):
+        data = data.decode('utf-8')
+
+    try:
+        # Legacy message
+        float(data)
+        return None, None, None
+
+    except ValueError:
+        pass
+
+    try:
+        message = json.loads(data)
+        revision = message['revision']
+        keys = message.get('keys')
+        since = message.get('since')
+
+        if revision is not None:
+            revision = int(revision)
+
+            # Single update by default
+            since = revision - 1 if since is None else int(since)
+
+        if keys is not None:
+            keys = [str(k) for k in keys]
+
+    except (AttributeError, KeyError, TypeError):
+        raise ValueError('Malformed notification message')
+
+    return revision, keys, since
+
+# Number of entries kept in the journal file
+_JOURNAL_SIZE = 100
+
+def _journal_path(file_path):
+    """Obtain the path to the journal file of a watch file.
+
+    Arguments:
+        file_path (str): Path to the watch file.
+
+    Returns:
+        Path to the journal file.
+    """
+    return file_path + '.keys'
+
+def _write_journal(journal_path, message):
+    """Append a notification message to the journal file.
+
+    When the journal grows too large, only the latest entries are kept.
+
+    Arguments:
+        journal_path (str): Path to the journal file.
+        message (str): Notification message to append.
+    """
+    with open(journal_path, 'a') as f:
+        f.write(message + '\n')
+
+    with open(journal_path, 'r') as f:
+        lines = f.readlines()
+
+    if len(lines) <= _JOURNAL_SIZE * 2:
+        return
+
+    # Replace atomically so that readers never see a partial journal
+    tmp_path = '%s.%d' % (journal_path, os.getpid())
+
+    with open(tmp_path, 'w') as f:
+        f.writelines(lines[-_JOURNAL_SIZE:])
+
+    os.rename(tmp_path, journal_path)
+
+def _read_journal(journal_path, since):
+    """Obtain the keys that changed after the given revision.
 
-def _dummy(state):
+    Arguments:
+        journal_path (str): Path to the journal file.
+        since (int): Revision currently loaded.
+
+    Returns:
+        tuple with the latest revision found in the journal (``None`` if
+        unknown) and the list of keys that changed since the given revision
+        (``None`` if all the keys should be reloaded because the journal is
+        missing, malformed or some entries were discarded).
+    """
+    try:
+        with open(journal_path, 'r') as f:
+            lines = f.readlines()
+
+    except (IOError, OSError):
+        return None, None
+
+    entries = []
+
+    for line in lines:
+        try:
+            entry = _parse_message(line.strip())
+
+        except ValueError:
+            return None, None
+
+        if entry[0] is None:
+            return None, None
+
+        entries.append(entry)
+
+    if not entries:
+        return None, None
+
+    latest = max(revision for revision, _, _ in entries)
+
+    if since is None:
+        return latest, None
+
+    revisions = set()
+    changed = set()
+
+    for revision, keys, first in entries:
+        if revision <= since:
+            continue
+
+        if keys is None:
+            return latest, None
+
+        revisions.update(range(max(first, since) + 1, revision + 1))
+        changed.update(keys)
+
+    if revisions != set(range(since + 1, latest + 1)):
+        # Some changes are not in the journal
+        return latest, None
+
+    return latest, list(changed)
+
+def _dummy(state, keys=None, revision=None, since=None):
     """Does nothing."""
     pass
+
+def get_hub():
+    """Obtain the watcher hub shared by all the applications of the process.
+
+    Returns:
+        :py:class:`WatcherHub` instance, created the first time.
+    """
+    global _hub
+
+    with _hub_lock:
+        if _hub is None:
+            _hub = WatcherHub()
+
+    return _hub
+
+def _redis_server(conf):
+    """Identify the redis server used by an application.
+
+    Arguments:
+        conf (dict): Application configuration.
+
+    Returns:
+        tuple of the settings that determine the server.
+    """
+    return (
+        conf.get('WAFFLE_REDIS_URL'),
+        conf.get('WAFFLE_REDIS_UNIX_SOCKET'),
+        conf.get('WAFFLE_REDIS_HOST', 'localhost'),
+        conf.get('WAFFLE_REDIS_PORT', 6379))
+
+
+class WatcherHub(object):
+    """Watch for configuration updates of several applications.
+
+    Used when the ``WAFFLE_SHARED_WATCHER`` setting is set, instead of
+    starting a watcher thread for each application. The watch files of all
+    the registered applications are checked in a single thread, while
+    applications that use redis share a thread, a connection pool and a
+    subscription for each redis server. Notifications are routed to the
+    applications subscribed to the channel they were received from.
+
+    Use :py:func:`get_hub` to obtain the hub of the process.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._files = None
+
+        # Redis server -> _RedisGroup
+        self._redis = {}
+
+    def register(self, state):
+        """Start watching for configuration updates of an application.
+
+        Arguments:
+            state (_WaffleState): Object that contains reference to app and
+                its configstore.
+
+        Returns:
+            ``threading.Thread`` that watches for the updates.
+        """
+        conf = state.app.config
+        watcher_type = conf.get('WAFFLE_WATCHTYPE', 'file')
+
+        with self._lock:
+            if watcher_type == 'redis' and _HAS_REDIS:
+                server = _redis_server(conf)
+                group = self._redis.get(server)
+
+                if group is None:
+                    group = _RedisGroup(conf)
+                    self._redis[server] = group
+
+                group.add(state)
+
+            else:
+                if self._files is None:
+                    self._files = _FileGroup()
+
+                group = self._files
+                group.add(state, watcher_type == 'inotify' and _HAS_INOTIFY)
+
+        return group.thread
+
+
+class _FileGroup(object):
+    """Check the watch files of several applications in a single thread.
+
+    Files of applications that use the inotify watcher share a single
+    inotify instance and are checked as soon as they change. Reload delays
+    (see :py:func:`_reload_delay`) are scheduled for each application
+    instead of waiting in the shared thread.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = []
+        self._fd = -1
+
+        # Set when an entry is added while waiting
+        self._added = threading.Event()
+
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def add(self, state, inotify=False):
+        """Start checking the watch file of an application.
+
+        Arguments:
+            state (_WaffleState): Object that contains reference to app and
+                its configstore.
+            inotify (bool): Whether to wait for inotify events.
+        """
+        interval = state.app.config.get('WAFFLE_WATCHER_INTERVAL', 10)
+        entry = {
+            'state': state,
+            'path': _prepare_file(state),
+            'interval': interval,
+            'next': _now() + interval,
+            'inotify': False,
+
+            # Changes waiting for the reload delay and time to reload them
+            'changes': None,
+            'reload_at': None,
+        }
+
+        with self._lock:
+            if inotify and self._fd < 0:
+                self._fd = _libc.inotify_init1(_IN_CLOEXEC)
+
+            if inotify and self._fd >= 0:
+                entry['inotify'] = True
+                _libc.inotify_add_watch(
+                    self._fd, entry['path'].encode('utf-8'), _IN_MASK)
+
+            self._entries.append(entry)
+
+        self._added.set()
+
+    def _watch_all(self):
+        """Add the inotify watches again after some of them were removed."""
+        with self._lock:
+            for entry in self._entries:
+                if not entry['inotify']:
+                    continue
+
+                if not os.path.isfile(entry['path']):
+                    # Create watch file
+                    open(entry['path'], 'a').close()
+
+                _libc.inotify_add_watch(
+                    self._fd, entry['path'].encode('utf-8'), _IN_MASK)
+
+    def _run(self):
+        """Check the files that are due and wait for the next check."""
+        while True:
+            with self._lock:
+                entries = list(self._entries)
+                fd = self._fd
+
+            for entry in entries:
+                if entry['next'] <= _now() or (
+                        entry['reload_at'] is not None and
+                        entry['reload_at'] <= _now()):
+                    _check_entry(entry)
+
+            due = [e['next'] for e in entries] + [
+                e['reload_at'] for e in entries if e['reload_at'] is not None]
+
+            if due:
+                timeout = max(min(due) - _now(), 0)
+
+            else:
+                timeout = _HUB_POLL
+
+            if fd < 0:
+                self._added.wait(timeout)
+                self._added.clear()
+                continue
+
+            readable, _, _ = select.select([fd], [], [], timeout)
+
+            if not readable:
+                continue
+
+            if _watch_removed(os.read(fd, 4096)):
+                # Files were deleted or replaced, watch them again
+                self._watch_all()
+
+            for entry in entries:
+                if entry['inotify']:
+                    entry['next'] = 0
+
+def _check_entry(entry):
+    """Check the watch file of an application and reload config when due.
+
+    Errors are logged so that they do not affect other applications.
+
+    Arguments:
+        entry (dict): Watch file entry of the application (see
+            :py:meth:`_FileGroup.add`).
+    """
+    state = entry['state']
+
+    try:
+        if entry['next'] <= _now():
+            entry['next'] = _now() + entry['interval']
+
+            # Changes notified while waiting replace the previous ones
+            entry['changes'] = _file_changes(
+                state, entry['path']) or entry['changes']
+
+        if entry['changes'] is None:
+            return
+
+        if entry['reload_at'] is None:
+            entry['reload_at'] = _now() + _reload_delay(state)
+
+        if entry['reload_at'] > _now():
+            return
+
+        changes = entry['changes']
+        entry['changes'] = entry['reload_at'] = None
+
+        _reload(state, *changes)
+
+    except Exception:
+        state.app.logger.exception('Could not reload configuration')
+
+        # Check the file again next time
+        state._signature = None
+
+
+class _RedisGroup(object):
+    """Share a redis subscription between several applications.
+
+    Reload delays (see :py:func:`_reload_delay`) are scheduled for each
+    application instead of waiting in the shared thread.
+
+    Arguments:
+        conf (dict): Configuration of the first application, used to create
+            the connection pool.
+    """
+
+    def __init__(self, conf):
+        self.pool = _redis_pool(conf, redis.ConnectionPool)
+
+        self._lock = threading.Lock()
+
+        # Channel -> list of states
+        self._channels = {}
+
+        # Channels and events of the applications waiting for the thread to
+        # subscribe (see add())
+        self._waiting = []
+
+        # Used by add() to wake up the thread
+        self._control = 'waffleconf-hub:%d:%d' % (os.getpid(), id(self))
+
+        # State -> [raw messages, time to reload them]
+        self._pending = {}
+
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def add(self, state):
+        """Route the notifications of the channel of an application to it.
+
+        Waits until the channel is subscribed, so that notifications sent
+        after initializing the application are not lost. The application
+        also uses the connection pool of the group to send its own
+        notifications.
+
+        Arguments:
+            state (_WaffleState): Object that contains reference to app and
+                its configstore.
+        """
+        channel = state.app.config.get('WAFFLE_REDIS_CHANNEL', 'waffleconf')
+        subscribed = threading.Event()
+
+        with _pool_lock:
+            if state._redis_pool is None:
+                state._redis_pool = self.pool
+
+        with self._lock:
+            self._channels.setdefault(channel, []).append(state)
+            self._waiting.append((channel, subscribed))
+
+        try:
+            redis.StrictRedis(connection_pool=self.pool).publish(
+                self._control, '')
+
+        except redis.exceptions.RedisError:
+            # Subscribed (and reloaded) when the connection is restored
+            return
+
+        subscribed.wait(_HUB_POLL * 2)
+
+    def _subscribe(self, sub, subscribed):
+        """Subscribe to the channels of the newly added applications.
+
+        Arguments:
+            sub: ``redis.client.PubSub`` instance.
+            subscribed (set): Channels already subscribed, updated in place.
+
+        Returns:
+            dict mapping each channel to the list of its states.
+        """
+        with self._lock:
+            channels = dict((k, list(v)) for k, v in self._channels.items())
+            waiting = self._waiting
+            self._waiting = []
+
+        new = [c for c in channels if c not in subscribed]
+
+        if self._control not in subscribed:
+            new.append(self._control)
+
+        if new:
+            sub.subscribe(*new)
+            subscribed.update(new)
+
+        for _, event in waiting:
+            event.set()
+
+        return channels
+
+    def _run(self):
+        """Listen to the channels of all the applications."""
+        client = redis.StrictRedis(connection_pool=self.pool)
+        sub = client.pubsub(ignore_subscribe_messages=True)
+        subscribed = set()
+
+        while True:
+            try:
+                channels = self._subscribe(sub, subscribed)
+
+                self._reload_due()
+
+                due = [at for _, at in self._pending.values()]
+                timeout = min([_HUB_POLL] + [at - _now() for at in due])
+
+                msg = sub.get_message(timeout=max(timeout, 0))
+
+                if msg is None:
+                    continue
+
+                # Queue the messages received during the previous reloads
+                # along with this one
+                for msg in [msg] + _drain(sub):
+                    channel = msg['channel']
+
+                    if isinstance(channel, bytes):
+                        channel = channel.decode('utf-8')
+
+                    for state in channels.get(channel, []):
+                        self._queue(state, msg['data'])
+
+            except redis.exceptions.TimeoutError:
+                sub.reset()
+                subscribed.clear()
+                self._reload_all()
+
+            except redis.exceptions.ConnectionError:
+                sub.reset()
+                subscribed.clear()
+                time.sleep(_REDIS_RETRY_DELAY)
+                self._reload_all()
+
+    def _queue(self, state, data):
+        """Queue a notification message until the application reloads.
+
+        Arguments:
+            state (_WaffleState): Object that contains reference to app and
+                its configstore.
+            data: Raw message received.
+        """
+        pending = self._pending.get(state)
+
+        if pending is None:
+            pending = [[], _now() + _reload_delay(state)]
+            self._pending[state] = pending
+
+        pending[0].append(data)
+
+    def _reload_due(self):
+        """Reload the applications whose reload delay has elapsed."""
+        for state, (messages, at) in list(self._pending.items()):
+            if at > _now():
+                continue
+
+            del self._pending[state]
+
+            try:
+                changes = _message_changes(state, messages)
+
+                if changes:
+                    _reload(state, *changes)
+
+            except Exception:
+                state.app.logger.exception('Could not reload configuration')
+
+    def _reload_all(self):
+        """Reload all the applications after losing the connection."""
+        self._pending.clear()
+
+        with self._lock:
+            states = [s for v in self._channels.values() for s in v]
+
+        for state in states:
+            try:
+                _reload(state, None, None)
+
+            except Exception:
+                state.app.logger.exception('Could not reload configuration')
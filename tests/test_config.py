@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+#
+# Flask-WaffleConf - https://github.com/rmed/flask-waffleconf
+#
+# Copyright (C) 2015, 2016  Rafael Medina García <rafamedgar@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""Tests for the SQLAlchemy and peewee stores on an in-memory SQLite."""
+
+"""Tests for the lazy application configuration."""
+
+import unittest
+
+import peewee
+from flask import Flask, Config, render_template_string
+
+from flask_waffleconf import PeeweeWaffleStore, WaffleConf, WaffleMixin
+from flask_waffleconf.config import LazyConfig
+
+
+class CustomConfig(Config):
+    pass
+
+
+class LazyConfigTests(unittest.TestCase):
+
+    settings = {'WAFFLE_LAZY': True}
+
+    def setUp(self):
+        db = peewee.SqliteDatabase(':memory:')
+
+        class Config(peewee.Model, WaffleMixin):
+            key = peewee.CharField(unique=True)
+            value = peewee.TextField()
+
+            class Meta:
+                database = db
+
+        db.create_tables([Config])
+        self.addCleanup(db.close)
+        self.store = PeeweeWaffleStore(db, Config)
+
+    def make_app(self, config_class=Config):
+        app = Flask(__name__)
+        app.config_class = config_class
+        app.config = app.make_config()
+        app.config['WAFFLE_CONFS'] = {
+            'A': {'desc': 'A', 'default': 'old'},
+            'B': {'desc': 'B', 'default': 'x' * 100},
+        }
+        app.config.update(self.settings)
+
+        return app
+
+    def test_config_kept(self):
+        app = self.make_app()
+        config = app.config
+        state = WaffleConf(app, self.store).state
+
+        self.assertIs(app.config, config)
+        self.assertIsInstance(app.config, LazyConfig)
+        self.assertIs(app.config.state, state)
+
+    def test_custom_config_class(self):
+        app = self.make_app(CustomConfig)
+        WaffleConf(app, self.store)
+
+        self.assertIsInstance(app.config, LazyConfig)
+        self.assertIsInstance(app.config, CustomConfig)
+
+    def test_template_config(self):
+        app = self.make_app()
+
+        # Creates the Jinja environment before initializing the extension
+        @app.template_filter()
+        def upper(value):
+            return value.upper()
+
+        state = WaffleConf(app, self.store).state
+
+        with app.app_context():
+            state.parse_conf()
+            state.update_db({'A': 'new'})
+
+            self.assertEqual(app.config['A'], 'new')
+            self.assertEqual(
+                render_template_string('{{ config.A|upper }}'), 'NEW')
+
+
+class LazyValuesConfigTests(LazyConfigTests):
+
+    settings = {'WAFFLE_LAZY_VALUES': 10}
+
+    def test_template_lazy_value(self):
+        app = self.make_app()
+        app.jinja_env
+        state = WaffleConf(app, self.store).state
+
+        with app.app_context():
+            state.update_conf()
+
+            self.assertEqual(
+                render_template_string('{{ config.B }}'), 'x' * 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
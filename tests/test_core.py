@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+#
+# Flask-WaffleConf - https://github.com/rmed/flask-waffleconf
+#
+# Copyright (C) 2015, 2016  Rafael Medina García <rafamedgar@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""Tests for the SQLAlchemy and peewee stores on an in-memory SQLite."""
+
+"""Tests for the state of the extension."""
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import peewee
+from flask import Flask
+
+from flask_waffleconf import (CachedWaffleStore, PeeweeWaffleStore,
+                              WaffleConf, WaffleMixin, snapshot)
+
+
+class StateTests(object):
+    """Create states that share a database file."""
+
+    def setUp(self):
+        # Shared by the threads of the tests
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        db = peewee.SqliteDatabase(os.path.join(self.tmp_dir, 'waffle.db'))
+
+        class Config(peewee.Model, WaffleMixin):
+            key = peewee.CharField(unique=True)
+            value = peewee.TextField()
+
+            class Meta:
+                database = db
+
+        db.create_tables([Config])
+        self.addCleanup(db.close)
+        self.db = db
+        self.model = Config
+        self.sent = []
+
+    def make_state(self, config=None, cached=False):
+        app = Flask(__name__)
+        app.config['WAFFLE_CONFS'] = {
+            'A': {'desc': 'A', 'default': 1},
+            'B': {'desc': 'B', 'default': 2},
+        }
+        app.config.update(config or {})
+
+        store = PeeweeWaffleStore(self.db, self.model)
+
+        if cached:
+            store = CachedWaffleStore(store)
+
+        state = WaffleConf(app, store).state
+
+        # Record notifications instead of starting a watcher
+        app.config['WAFFLE_MULTIPROC'] = True
+        state.notify = lambda state, keys, revision, since: \
+            self.sent.append((sorted(keys or []), revision, since))
+
+        return state
+
+
+class BatchTests(StateTests, unittest.TestCase):
+
+    def setUp(self):
+        super(BatchTests, self).setUp()
+        self.state = self.make_state()
+
+    def test_batch(self):
+        with self.state.batch():
+            self.state.update_db({'A': 10})
+
+            with self.state.batch():
+                self.state.update_db({'B': 20})
+
+            self.assertEqual(self.sent, [])
+
+        self.assertEqual(self.sent, [(['A', 'B'], 2, 0)])
+
+    def test_batch_other_thread(self):
+        entered = threading.Event()
+        updated = threading.Event()
+
+        def run():
+            with self.state.batch():
+                self.state.update_db({'A': 10})
+                entered.set()
+                updated.wait(5)
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        entered.wait(5)
+
+        # Not held back by the block of the other thread
+        self.state.update_db({'B': 20})
+        self.assertEqual(self.sent, [(['B'], 2, 1)])
+
+        updated.set()
+        thread.join(5)
+        self.assertEqual(self.sent, [(['B'], 2, 1), (['A'], 1, 0)])
+
+
+class SharedSnapshotTests(StateTests, unittest.TestCase):
+
+    def test_cached_values(self):
+        path = os.path.join(self.tmp_dir, 'shared.snapshot')
+        state = self.make_state({'WAFFLE_SHARED_SNAPSHOT': path}, True)
+        state.parse_conf()
+
+        # Cached value of B is outdated until the notification is handled
+        self.make_state().update_db({'B': 20})
+        state.update_db({'A': 10})
+
+        revision, values = snapshot.read(path)
+        self.assertEqual(revision, 2)
+        self.assertEqual(values, {
+            'A': state._serialize(10),
+            'B': state._serialize(20),
+        })
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,348 @@
+# -*- coding: utf-8 -*-
+#
+# Flask-WaffleConf - https://github.com/rmed/flask-waffleconf
+#
+# Copyright (C) 2015, 2016  Rafael Medina García <rafamedgar@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""Tests for the config stores on SQLite and an in-process Redis."""
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+import peewee
+from flask import Flask
+from flask_sqlalchemy import SQLAlchemy
+
+from flask_waffleconf import (AlchemyWaffleStore, PeeweeWaffleStore,
+                              RedisWaffleStore, SQLiteWaffleStore,
+                              WaffleMixin)
+from flask_waffleconf.store import _BATCH_SIZE
+
+try:
+    import fakeredis
+    _HAS_FAKEREDIS = True
+
+except ImportError:
+    _HAS_FAKEREDIS = False
+
+
+class StoreTests(object):
+    """Common tests for the config stores.
+
+    Subclasses must create ``self.store`` in ``make_store()``.
+    """
+
+    def setUp(self):
+        self.store = self.make_store()
+
+    def values(self):
+        """Return stored values, including duplicated records."""
+        raise NotImplementedError
+
+    def test_put_insert(self):
+        record = self.store.put('SITENAME', '"waffle"')
+        self.store.commit()
+
+        self.assertEqual(record.key, 'SITENAME')
+        self.assertEqual(record.value, '"waffle"')
+        self.assertEqual(self.store.get('SITENAME').value, '"waffle"')
+
+    def test_put_update(self):
+        self.store.put('SITENAME', '"waffle"')
+        self.store.commit()
+        self.store.put('SITENAME', '"pancake"')
+        self.store.commit()
+
+        self.assertEqual(self.store.get('SITENAME').value, '"pancake"')
+        self.assertEqual(self.values(), [('SITENAME', '"pancake"')])
+
+    def test_put_many(self):
+        self.store.put_many({'A': '1', 'B': '2'})
+        self.store.commit()
+        records = self.store.put_many({'B': '3', 'C': '4'})
+        self.store.commit()
+
+        self.assertEqual(
+            sorted((r.key, r.value) for r in records),
+            [('B', '3'), ('C', '4')])
+        self.assertEqual(
+            self.values(), [('A', '1'), ('B', '3'), ('C', '4')])
+
+    def test_get_many(self):
+        self.store.put_many({'A': '1', 'B': '2'})
+        self.store.commit()
+
+        records = self.store.get_many(['A', 'C'])
+
+        self.assertEqual(list(records.keys()), ['A'])
+        self.assertEqual(records['A'].value, '1')
+
+    def test_get_many_large(self):
+        values = dict(
+            ('K%d' % i, str(i)) for i in range(_BATCH_SIZE + 10))
+        self.store.put_many(values)
+        self.store.put('OTHER', '0')
+        self.store.commit()
+
+        records = self.store.get_many(list(values.keys()) + ['MISSING'])
+
+        self.assertEqual(
+            dict((key, r.value) for key, r in records.items()), values)
+
+    def test_delete(self):
+        self.store.put('SITENAME', '"waffle"')
+        self.store.commit()
+
+        self.assertEqual(self.store.delete('SITENAME').key, 'SITENAME')
+        self.store.commit()
+        self.assertIsNone(self.store.get('SITENAME'))
+
+    def test_delete_missing(self):
+        self.assertIsNone(self.store.delete('SITENAME'))
+
+    def test_bump_revision(self):
+        self.assertEqual(self.store.bump_revision(), 1)
+        self.assertEqual(self.store.bump_revision(), 2)
+        self.store.commit()
+
+        self.assertEqual(self.store.get_revision(), 2)
+
+
+class OrmStoreTests(StoreTests):
+    """Common tests for the SQLAlchemy and peewee stores.
+
+    Upserts are only used when the ``key`` column is unique.
+    """
+
+    unique = True
+
+    def create(self, key, value):
+        """Insert a record without checking for existing ones."""
+        raise NotImplementedError
+
+    def test_upsert_used(self):
+        self.assertEqual(self.store._upsert({}), self.unique)
+
+    def test_bump_revision_duplicates(self):
+        if self.unique:
+            self.skipTest('records cannot be duplicated')
+
+        # Created by concurrent first updates
+        self.create('WAFFLE_REVISION', '1')
+        self.create('WAFFLE_REVISION', '2')
+        self.store.commit()
+
+        self.assertEqual(self.store.bump_revision(), 3)
+        self.store.commit()
+
+        self.assertEqual(self.store.get_revision(), 3)
+        self.assertEqual(self.values(), [('WAFFLE_REVISION', '3')])
+
+
+class AlchemyStoreTests(OrmStoreTests, unittest.TestCase):
+
+    def make_store(self):
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        db = SQLAlchemy(app)
+        unique = self.unique
+
+        class Config(db.Model, WaffleMixin):
+            id = db.Column(db.Integer, primary_key=True)
+            key = db.Column(db.String(255), unique=unique)
+            value = db.Column(db.Text)
+
+        context = app.app_context()
+        context.push()
+        self.addCleanup(context.pop)
+        db.create_all()
+
+        return AlchemyWaffleStore(db, Config)
+
+    def create(self, key, value):
+        self.store.db.session.add(self.store.model(key=key, value=value))
+
+    def values(self):
+        query = self.store.db.session.query(
+            self.store.model.key, self.store.model.value)
+
+        return sorted(tuple(row) for row in query)
+
+
+class AlchemyNoUniqueStoreTests(AlchemyStoreTests):
+    unique = False
+
+
+class PeeweeStoreTests(OrmStoreTests, unittest.TestCase):
+
+    def make_store(self):
+        db = peewee.SqliteDatabase(':memory:')
+        unique = self.unique
+
+        class Config(peewee.Model, WaffleMixin):
+            key = peewee.CharField(unique=unique)
+            value = peewee.TextField()
+
+            class Meta:
+                database = db
+
+        db.create_tables([Config])
+        self.addCleanup(db.close)
+
+        return PeeweeWaffleStore(db, Config)
+
+    def create(self, key, value):
+        self.store.model.create(key=key, value=value)
+
+    def values(self):
+        query = self.store.model.select().tuples()
+
+        return sorted((key, value) for _, key, value in query)
+
+
+class PeeweeNoUniqueStoreTests(PeeweeStoreTests):
+    unique = False
+
+
+class SQLiteStoreTests(StoreTests, unittest.TestCase):
+
+    def make_store(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        self.path = os.path.join(tmp_dir, 'waffle.db')
+
+        return SQLiteWaffleStore(self.path, timeout=0)
+
+    def values(self):
+        query = self.store._connection().execute(
+            self.store._sql['get_all'])
+
+        return sorted(tuple(row) for row in query)
+
+    def connect(self):
+        """Open another connection to the database."""
+        conn = sqlite3.connect(self.path, timeout=0, isolation_level=None)
+        self.addCleanup(conn.close)
+
+        return conn
+
+    def test_wal_mode(self):
+        self.store.get('SITENAME')
+        mode = self.connect().execute('PRAGMA journal_mode').fetchone()[0]
+
+        self.assertEqual(mode, 'wal')
+
+    def test_read_while_writing(self):
+        self.store.put('SITENAME', '"waffle"')
+        self.store.commit()
+        self.store.put('SITENAME', '"pancake"')
+
+        # Readers see the last committed value without waiting
+        row = self.connect().execute(
+            'SELECT value FROM waffleconf WHERE key = ?',
+            ('SITENAME',)).fetchone()
+        self.assertEqual(row[0], '"waffle"')
+
+        self.store.rollback()
+        self.assertEqual(self.store.get('SITENAME').value, '"waffle"')
+
+    def test_delete_missing_no_lock(self):
+        self.assertIsNone(self.store.delete('SITENAME'))
+
+        # Other writers do not have to wait for a commit
+        conn = self.connect()
+        conn.execute('BEGIN IMMEDIATE')
+        conn.execute('ROLLBACK')
+
+
+@unittest.skipUnless(_HAS_FAKEREDIS, 'fakeredis is not installed')
+class RedisStoreTests(StoreTests, unittest.TestCase):
+
+    def make_store(self):
+        return RedisWaffleStore(fakeredis.FakeStrictRedis())
+
+    def values(self):
+        values = self.store.db.hgetall(self.store.key)
+
+        return sorted(
+            (key.decode('utf-8'), value.decode('utf-8'))
+            for key, value in values.items())
+
+    def test_get_many_small(self):
+        self.store.put_many({'A': '1', 'B': '2'})
+        self.store.commit()
+
+        # Only the given keys are obtained (HMGET)
+        self.store.db.hgetall = None
+        records = self.store.get_many(['A', 'C'])
+
+        self.assertEqual(list(records.keys()), ['A'])
+
+    def test_get_many_hgetall(self):
+        self.store.put_many({'A': '1', 'B': '2'})
+        self.store.commit()
+
+        # The whole hash is obtained above _BATCH_SIZE keys (HGETALL)
+        self.store.db.hmget = None
+        keys = ['A'] + ['K%d' % i for i in range(_BATCH_SIZE)]
+        records = self.store.get_many(keys)
+
+        self.assertEqual(list(records.keys()), ['A'])
+
+    def test_commit(self):
+        self.store.put('SITENAME', '"waffle"')
+
+        # Writes are queued until committing
+        self.assertIsNone(self.store.get('SITENAME'))
+
+        self.store.commit()
+        self.assertEqual(self.store.get('SITENAME').value, '"waffle"')
+
+    def test_rollback(self):
+        self.store.put('SITENAME', '"waffle"')
+        self.store.rollback()
+        self.store.commit()
+
+        self.assertIsNone(self.store.get('SITENAME'))
+
+    def test_rollback_thread_pipeline(self):
+        self.store.put('A', '1')
+        thread = threading.Thread(target=self.store.rollback)
+        thread.start()
+        thread.join()
+
+        # Pipelines of other threads are not affected
+        self.store.commit()
+        self.assertEqual(self.store.get('A').value, '1')
+
+    def test_bump_revision_sends_writes(self):
+        self.store.put_many({'A': '1', 'B': '2'})
+
+        self.assertEqual(self.store.bump_revision(), 1)
+
+        # Sent along with the increment, nothing left to commit
+        self.assertIsNone(self.store._local.pipe)
+        self.assertEqual(
+            self.values(), [('A', '1'), ('B', '2'), ('WAFFLE_REVISION', '1')])
+
+
+if __name__ == '__main__':
+    unittest.main()
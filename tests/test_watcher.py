@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+#
+# Flask-WaffleConf - https://github.com/rmed/flask-waffleconf
+#
+# Copyright (C) 2015, 2016  Rafael Medina García <rafamedgar@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""Tests for the SQLAlchemy and peewee stores on an in-memory SQLite."""
+
+"""Tests for the watchers of configuration updates."""
+
+import asyncio
+import os
+import shutil
+import tempfile
+import unittest
+
+import peewee
+from flask import Flask
+
+from flask_waffleconf import (PeeweeWaffleStore, WaffleConf, WaffleMixin,
+                              aiowatcher, watcher)
+
+
+class ReloadErrorTests(unittest.TestCase):
+    """Watchers keep running and retry when the store fails."""
+
+    def setUp(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        self.watch_file = os.path.join(tmp_dir, 'watch.txt')
+
+        db = peewee.SqliteDatabase(os.path.join(tmp_dir, 'waffle.db'))
+
+        class Config(peewee.Model, WaffleMixin):
+            key = peewee.CharField(unique=True)
+            value = peewee.TextField()
+
+            class Meta:
+                database = db
+
+        db.create_tables([Config])
+        self.addCleanup(db.close)
+
+        self.writer = self.make_state(db, Config)
+        self.reader = self.make_state(db, Config)
+        self.writer.parse_conf()
+        self.reader.update_conf()
+
+        # Notify through the watch file without starting the watchers
+        self.writer.app.config['WAFFLE_MULTIPROC'] = True
+        self.writer.notify = watcher.get_notifier('file')
+        watcher._prepare_file(self.reader)
+
+        # Fail the next read of the reader
+        store = self.reader.configstore
+        get_many = store.get_many
+        self.failures = 1
+
+        def failing_get_many(keys):
+            if self.failures:
+                self.failures -= 1
+                raise peewee.OperationalError('database is locked')
+
+            return get_many(keys)
+
+        store.get_many = failing_get_many
+
+    def make_state(self, db, model):
+        app = Flask(__name__)
+        app.config['WAFFLE_CONFS'] = {'A': {'desc': 'A', 'default': 1}}
+        app.config['WAFFLE_WATCHER_FILE'] = self.watch_file
+
+        return WaffleConf(app, PeeweeWaffleStore(db, model)).state
+
+    def test_check_file(self):
+        self.writer.update_db({'A': 2})
+
+        with self.assertLogs(self.reader.app.logger, 'ERROR'):
+            watcher._check_file(self.reader, self.watch_file)
+
+        self.assertEqual(self.reader.app.config['A'], 1)
+
+        # Retried by the next check
+        watcher._check_file(self.reader, self.watch_file)
+        self.assertEqual(self.reader.app.config['A'], 2)
+
+    def test_async_check_file(self):
+        self.writer.update_db({'A': 2})
+
+        with self.assertLogs(self.reader.app.logger, 'ERROR'):
+            asyncio.run(aiowatcher._check_file(self.reader, self.watch_file))
+
+        self.assertEqual(self.reader.app.config['A'], 1)
+
+        asyncio.run(aiowatcher._check_file(self.reader, self.watch_file))
+        self.assertEqual(self.reader.app.config['A'], 2)
+
+    def test_handle_message(self):
+        self.writer.update_db({'A': 2})
+        self.writer.update_db({'A': 3})
+
+        with self.assertLogs(self.reader.app.logger, 'ERROR'):
+            watcher._handle_message(
+                self.reader, watcher._build_message(1, ['A'], 0))
+
+        self.assertEqual(self.reader.app.config['A'], 1)
+
+        # Revision 1 was not loaded: the next message reloads everything
+        watcher._handle_message(
+            self.reader, watcher._build_message(2, ['A'], 1))
+        self.assertEqual(self.reader.app.config['A'], 3)
+
+
+@unittest.skipUnless(aiowatcher._HAS_REDIS, 'redis is not installed')
+class AsyncNotifierTests(unittest.TestCase):
+
+    def test_publish_error(self):
+        app = Flask(__name__)
+        app.config['WAFFLE_CONFS'] = {}
+
+        # Nothing listens on this port
+        app.config['WAFFLE_REDIS_URL'] = 'redis://127.0.0.1:1'
+        state = WaffleConf(app, PeeweeWaffleStore()).state
+
+        async def notify():
+            state._loop = asyncio.get_running_loop()
+            aiowatcher._redis_notifier(state, ['A'], 1, 0)
+
+            # Referenced until finished
+            tasks = list(state._publishing)
+            self.assertEqual(len(tasks), 1)
+
+            await asyncio.wait(tasks)
+            self.assertEqual(state._publishing, set())
+
+        with self.assertLogs(app.logger, 'ERROR'):
+            asyncio.run(notify())
+
+
+if __name__ == '__main__':
+    unittest.main()